@@ -1,142 +1,91 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user, UserMixin
+from flask import Blueprint, Flask, current_app, render_template, request, redirect, url_for, flash, jsonify
+from markupsafe import Markup
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
-from flask_sqlalchemy import SQLAlchemy
+from datetime import date, datetime, timedelta, timezone
 import json
 import os
-import csv
-import io
-from flask import Response
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'dev-key-please-change-in-production'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///devices.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# 初始化数据库
-db = SQLAlchemy(app)
+import time
+import click
+from flask import Response, stream_with_context
+from pagination import keyset_paginate, iter_keyset_batches
+from csv_export import stream_csv
+import search_index
+import db_migrate
+import stats
+import utilization
+import device_import
+from cache import FragmentCache, VersionedCache
+from config import Config
+import sqlite_tuning
+import maintenance
+import change_journal
+from database import db
+from models import (User, InvitationCode, Device, BorrowRecord, Reservation, DeletedRecord,
+                    DeviceUsageDaily, SystemState, ACTIVE_BORROW_STATUSES, MAX_RESERVATION_DAYS)
+
+# 全部页面、接口和命令行命令都注册在这个蓝图上，由 create_app() 挂到应用
+bp = Blueprint('main', __name__, cli_group=None)
 
 # 初始化登录管理器
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-
-# 数据模型 - 修复 UserMixin 继承问题
-class User(db.Model, UserMixin):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(200), nullable=False)
-    role = db.Column(db.String(20), default='user')
-    active = db.Column(db.Boolean, default=True)  # 添加 active 字段
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    # 添加以下字段用于邀请码系统
-    real_name = db.Column(db.String(100))  # 真实姓名
-    department = db.Column(db.String(100))  # 部门
-    invitation_code_id = db.Column(db.Integer, db.ForeignKey('invitation_code.id'))  # 邀请码ID
-
-    # 关联关系
-    invitation_code = db.relationship('InvitationCode', foreign_keys=[invitation_code_id])
-
-    # Flask-Login 需要的属性
-    @property
-    def is_active(self):
-        return self.active
-    
-    @property
-    def is_authenticated(self):
-        return True
-    
-    @property
-    def is_anonymous(self):
-        return False
-    
-    def get_id(self):
-        return str(self.id)
-    
-    def __repr__(self):
-        return f'<User {self.username}>'
-
-
-class InvitationCode(db.Model):
-    """邀请码模型"""
-    id = db.Column(db.Integer, primary_key=True)
-    code = db.Column(db.String(50), unique=True, nullable=False)  # 邀请码
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # 创建人ID
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)  # 创建时间
-    expires_at = db.Column(db.DateTime)  # 过期时间
-    max_uses = db.Column(db.Integer, default=1)  # 最大使用次数
-    used_count = db.Column(db.Integer, default=0)  # 已使用次数
-    is_active = db.Column(db.Boolean, default=True)  # 是否有效
-    notes = db.Column(db.Text)  # 备注
-
-    # 关联关系
-    creator = db.relationship('User', foreign_keys=[created_by])
-
-    def __repr__(self):
-        return f'<InvitationCode {self.code}>'
-
-    @property
-    def is_expired(self):
-        """检查是否过期"""
-        if self.expires_at:
-            return datetime.utcnow() > self.expires_at
-        return False
-
-    @property
-    def can_use(self):
-        """检查是否可以使用"""
-        return (self.is_active and
-                not self.is_expired and
-                self.used_count < self.max_uses)
-
-    @property
-    def status(self):
-        """获取状态文本"""
-        if not self.is_active:
-            return '已禁用'
-        if self.is_expired:
-            return '已过期'
-        if self.used_count >= self.max_uses:
-            return '已用完'
-        return '有效'
-
-class Device(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(200), nullable=False)
-    number = db.Column(db.String(100), unique=True, nullable=False)
-    model = db.Column(db.String(100))
-    info = db.Column(db.Text)
-    calibration_date = db.Column(db.Date, nullable=False)
-    location = db.Column(db.String(200))
-    manager = db.Column(db.String(100))
-    status = db.Column(db.String(20), default='正常')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    def __repr__(self):
-        return f'<Device {self.name} - {self.number}>'
-
-class BorrowRecord(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=False)
-    borrower_name = db.Column(db.String(100), nullable=False)
-    borrower_department = db.Column(db.String(100))
-    borrower_contact = db.Column(db.String(50))
-    borrow_date = db.Column(db.Date, nullable=False)
-    expected_return_date = db.Column(db.Date)
-    actual_return_date = db.Column(db.Date)
-    borrow_purpose = db.Column(db.Text)
-    status = db.Column(db.String(20), default='借用中')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    device = db.relationship('Device', backref='borrow_records')
-    
-    def __repr__(self):
-        return f'<BorrowRecord {self.device.name} - {self.borrower_name}>'
+login_manager.login_view = 'main.login'
+
+
+def get_state(key):
+    state = db.session.get(SystemState, key)
+    return state.value if state else None
+
+
+def set_state(key, value):
+    """写入系统状态（调用方负责提交事务）"""
+    state = db.session.get(SystemState, key)
+    if state is None:
+        db.session.add(SystemState(key=key, value=value))
+    else:
+        state.value = value
+
+
+def stats_cache():
+    """当前应用的统计数据缓存，设备/借用数据写入后失效"""
+    return current_app.extensions['stats_cache']
+
+
+def current_stats():
+    """当前统计数据（优先读缓存）"""
+    return stats_cache().get_or_compute(
+        'stats', lambda: stats.collect_stats(db.session, Device, BorrowRecord))
 
 
-@app.route('/devices')
+def location_facets():
+    """设备列表的地点筛选项 [(地点, 设备数), ...]（优先读缓存）"""
+    return stats_cache().get_or_compute(
+        'locations', lambda: stats.location_facets(db.session, Device))
+
+
+def fragment_cache():
+    """当前应用的列表表格片段缓存"""
+    return current_app.extensions['fragment_cache']
+
+
+def data_changed(*tables):
+    """设备或借用数据提交后调用，使缓存的统计数据和依赖这些表（默认全部）的表格片段失效"""
+    stats_cache().bump()
+    fragment_cache().bump(*(tables or ('device', 'borrow_record')))
+
+
+# 设备列表可用的排序键（均为非空列，配合主键保证顺序稳定）
+DEVICE_SORT_COLUMNS = {
+    'id': Device.id,
+    'name': Device.name,
+    'number': Device.number,
+    'calibration_date': Device.calibration_date,
+}
+DEVICES_PER_PAGE = 20
+DEVICES_MAX_PER_PAGE = 100
+
+
+@bp.route('/devices')
 @login_required
 def devices():
     search = request.args.get('search', '')
@@ -144,14 +93,23 @@ def devices():
     location = request.args.get('location', '')
 
     query = Device.query
+    sort_columns = dict(DEVICE_SORT_COLUMNS)
 
     if search:
-        query = query.filter(
-            (Device.name.contains(search)) |
-            (Device.number.contains(search)) |
-            (Device.model.contains(search)) |
-            (Device.manager.contains(search))
-        )
+        # 优先走全文索引并按相关度排序，搜索词太短时回退到 LIKE
+        fts = search_index.match_subquery(search, db.engine)
+        if fts is not None:
+            query = query.join(fts, fts.c.id == Device.id)
+            sort_columns['rank'] = fts.c.rank
+        else:
+            # 与全文索引一致：空白分隔的多个词之间为 AND 关系
+            for term in search.split():
+                query = query.filter(
+                    (Device.name.contains(term)) |
+                    (Device.number.contains(term)) |
+                    (Device.model.contains(term)) |
+                    (Device.manager.contains(term))
+                )
 
     if status:
         query = query.filter_by(status=status)
@@ -159,36 +117,69 @@ def devices():
     if location:
         query = query.filter_by(location=location)
 
-    devices_list = query.all()
-
-    # 获取所有唯一的地点用于筛选
-    locations = db.session.query(Device.location).distinct().all()
-    locations = [loc[0] for loc in locations if loc[0]]
+    # 排序与键集分页
+    default_sort = 'rank' if 'rank' in sort_columns else 'id'
+    sort = request.args.get('sort', default_sort)
+    if sort not in sort_columns:
+        sort = default_sort
+    order = request.args.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        order = 'asc'
+    per_page = request.args.get('per_page', DEVICES_PER_PAGE, type=int)
+    per_page = min(max(per_page, 1), DEVICES_MAX_PER_PAGE)
+    cursor = request.args.get('cursor', '')
+
+    # 地点筛选项及各地点设备数（缓存，设备数据变化时失效）
+    locations = location_facets()
 
     # 统计信息
-    total_devices = Device.query.count()
-    available_devices = Device.query.filter_by(status='正常').count()
-    borrowed_devices = Device.query.filter_by(status='借用中').count()
+    device_stats = current_stats().devices
+
+    def render_table():
+        page = keyset_paginate(query,
+                               sort_columns[sort],
+                               Device.id,
+                               cursor=cursor,
+                               per_page=per_page,
+                               descending=(order == 'desc'))
+        return Markup(render_template('devices_table.html',
+                                      devices=page.items,
+                                      page=page,
+                                      search=search,
+                                      status=status,
+                                      location=location,
+                                      sort=sort,
+                                      order=order,
+                                      per_page=per_page,
+                                      total_devices=device_stats.total))
+
+    # 同样的筛选条件再次访问时直接用渲染好的表格，不再查询和渲染
+    device_table = fragment_cache().get_or_render(
+        ('device',), ('devices', search, status, location, sort, order, per_page, cursor), render_table)
 
     return render_template('devices.html',
-                           devices=devices_list,
+                           device_table=device_table,
                            search=search,
                            status=status,
                            location=location,
+                           sort=sort,
+                           order=order,
+                           ranked='rank' in sort_columns,
+                           per_page=per_page,
                            locations=locations,
-                           total_devices=total_devices,
-                           available_devices=available_devices,
-                           borrowed_devices=borrowed_devices)
+                           total_devices=device_stats.total,
+                           available_devices=device_stats.normal,
+                           borrowed_devices=device_stats.borrowed)
 
 
 # ========== 用户注册路由 ==========
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     """用户注册（需要邀请码）"""
     # 如果已登录，直接跳转到仪表板
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     if request.method == 'POST':
         # 获取表单数据
@@ -241,7 +232,7 @@ def register():
         if errors:
             for error in errors:
                 flash(error, 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
 
         # 创建新用户
         try:
@@ -265,20 +256,45 @@ def register():
             # 注册成功后自动登录
             login_user(new_user)
             flash('注册成功！欢迎使用设备管理系统。', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
 
         except Exception as e:
             db.session.rollback()
             flash(f'注册失败：{str(e)}', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
 
     return render_template('register.html')
 
-# 创建数据库表
-# 创建数据库表
-with app.app_context():
+def upgrade_columns():
+    """给已有数据库补加模型中新增的列，并回填需要初始值的列"""
+    added = db_migrate.add_missing_columns(db.engine, db.metadata)
+    if not added:
+        return
+    print(f"✓ 数据库已补加列: {', '.join(added)}")
+    # 新加的 updated_at 以创建时间作为初始值
+    with db.engine.begin() as conn:
+        for table_name in ('device', 'borrow_record'):
+            if f'{table_name}.updated_at' in added:
+                conn.execute(db.text(
+                    f"UPDATE {table_name} SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP) "
+                    f"WHERE updated_at IS NULL"
+                ))
+
+
+def init_database():
+    """创建数据库表、补加新增的列和全文索引，数据库中没有用户时创建默认管理员
+
+    由 flask init-db 显式执行；应用启动和工作进程导入时都不再触碰表结构。
+    """
     # 只创建表（如果不存在）
     db.create_all()
+    # 已有的表补加模型中新增的列
+    upgrade_columns()
+    # 设备全文索引（不存在时创建并从现有数据建立索引）
+    search_index.install(db.engine)
+    # 已有数据库转换为配置的 auto_vacuum 模式（重写整个文件，只在这里做一次）
+    if sqlite_tuning.convert_auto_vacuum(db.engine, current_app.config['SQLITE_AUTO_VACUUM']):
+        print(f"✓ 数据库已转换为 auto_vacuum={current_app.config['SQLITE_AUTO_VACUUM']}")
 
     # 检查是否有任何用户存在
     try:
@@ -313,19 +329,112 @@ with app.app_context():
         print(f"⚠ 检查用户时出错: {e}")
         print("ℹ 继续启动应用...")
 
+
+@bp.cli.command('init-db')
+def init_db_command():
+    """初始化或升级数据库（部署和升级后执行一次）"""
+    init_database()
+
+
+@bp.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """重建设备全文索引（用于已有数据库或索引损坏时）"""
+    count = search_index.rebuild(db.engine)
+    if search_index.is_available():
+        print(f"✓ 全文索引重建完成，共索引 {count} 个设备")
+    else:
+        print("⚠ 当前 SQLite 不支持 FTS5 trigram 分词器，未建立全文索引")
+
+
+def route_queries():
+    """各路由实际发出的查询，用于对比建索引前后的执行计划"""
+    today = datetime.now().date()
+    return [
+        ('devices: 按状态筛选', Device.query.filter_by(status='正常').order_by(Device.id).limit(21)),
+        ('devices: 按地点筛选', Device.query.filter_by(location='实验室').order_by(Device.id).limit(21)),
+        ('devices: 状态+地点筛选',
+         Device.query.filter_by(status='正常', location='实验室').order_by(Device.id).limit(21)),
+        ('devices: 按名称排序', Device.query.order_by(Device.name, Device.id).limit(21)),
+        ('devices: 按校准日期排序',
+         Device.query.order_by(Device.calibration_date, Device.id).limit(21)),
+        ('stats: 地点筛选项计数',
+         db.session.query(Device.location, db.func.count(Device.id)).group_by(Device.location)),
+        ('stats: 设备按状态分组计数',
+         db.session.query(Device.status, db.func.count(Device.id)).group_by(Device.status)),
+        ('borrow: 可借用设备', Device.query.filter(Device.status != '借用中')),
+        ('return: 借用中记录', BorrowRecord.query.filter(BorrowRecord.status.in_(ACTIVE_BORROW_STATUSES))),
+        ('borrow_records: 按创建时间倒序',
+         BorrowRecord.query.order_by(BorrowRecord.created_at.desc(), BorrowRecord.id.desc()).limit(51)),
+        ('borrow_records: 按状态筛选',
+         BorrowRecord.query.filter_by(status='已归还')
+         .order_by(BorrowRecord.created_at.desc(), BorrowRecord.id.desc()).limit(51)),
+        ('borrow_records: 按借用日期范围筛选',
+         BorrowRecord.query.filter(BorrowRecord.borrow_date >= today - timedelta(days=30),
+                                   BorrowRecord.borrow_date <= today)
+         .order_by(BorrowRecord.created_at.desc(), BorrowRecord.id.desc()).limit(51)),
+        ('borrow_records: 按设备筛选',
+         BorrowRecord.query.filter_by(device_id=1)
+         .order_by(BorrowRecord.created_at.desc(), BorrowRecord.id.desc()).limit(51)),
+        ('stats: 借用记录按状态分组计数',
+         db.session.query(BorrowRecord.status, db.func.count(BorrowRecord.id)).group_by(BorrowRecord.status)),
+        ('device.borrow_records: 设备借用历史', BorrowRecord.query.filter_by(device_id=1)),
+        ('超期: 未归还且已过预计归还日期', overdue_query(today).limit(51)),
+        ('超期: 批量标记超期未还',
+         BorrowRecord.query.filter(BorrowRecord.status == '借用中',
+                                   BorrowRecord.expected_return_date < today)),
+        ('changes: 设备增量同步',
+         Device.query.filter(Device.updated_at >= today)
+         .order_by(Device.updated_at, Device.id).limit(501)),
+        ('changes: 借用记录增量同步',
+         BorrowRecord.query.filter(BorrowRecord.updated_at >= today)
+         .order_by(BorrowRecord.updated_at, BorrowRecord.id).limit(501)),
+        ('reservation: 设备时段冲突检查',
+         Reservation.query.filter(Reservation.device_id == 1,
+                                  reservation_overlaps(today, today + timedelta(days=7)))),
+        ('reservation: 按型号查询空闲设备',
+         available_devices_query(today, today + timedelta(days=7)).filter(Device.model == 'X')),
+        ('utilization: 一年的日汇总按设备求和',
+         db.session.query(DeviceUsageDaily.device_id, db.func.sum(DeviceUsageDaily.borrowed_days))
+         .filter(DeviceUsageDaily.day >= today - timedelta(days=365), DeviceUsageDaily.day <= today)
+         .group_by(DeviceUsageDaily.device_id)),
+        ('utilization: 汇总时读取的借用记录',
+         BorrowRecord.query.filter(BorrowRecord.borrow_date <= today,
+                                   db.or_(BorrowRecord.actual_return_date.is_(None),
+                                          BorrowRecord.actual_return_date >= today))),
+        ('invitation_codes: 按创建时间倒序',
+         InvitationCode.query.order_by(InvitationCode.created_at.desc())),
+    ]
+
+
+@bp.cli.command('apply-indexes')
+def apply_indexes_command():
+    """为已有数据库补建模型中声明的索引（不删除数据）"""
+    queries = route_queries()
+    db_migrate.print_query_plans(db.engine, queries, '建索引前的执行计划')
+
+    created = db_migrate.create_missing_indexes(db.engine, db.metadata)
+    if created:
+        print(f"✓ 新建索引 {len(created)} 个: {', '.join(created)}")
+    else:
+        print("✓ 所有索引均已存在")
+    print()
+
+    db_migrate.print_query_plans(db.engine, queries, '建索引后的执行计划')
+
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
 # ========== 基本路由 ==========
 
-@app.route('/')
+@bp.route('/')
 def index():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
-    return redirect(url_for('login'))
+        return redirect(url_for('main.dashboard'))
+    return redirect(url_for('main.login'))
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -337,7 +446,7 @@ def login():
             if user.active:  # 检查用户是否激活
                 login_user(user, remember=True)
                 flash('登录成功！', 'success')
-                return redirect(url_for('dashboard'))
+                return redirect(url_for('main.dashboard'))
             else:
                 flash('用户账户已被禁用！', 'danger')
         else:
@@ -345,27 +454,25 @@ def login():
     
     return render_template('login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('已退出登录', 'info')
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
 def dashboard():
-    total_devices = Device.query.count()
-    active_borrows = BorrowRecord.query.filter_by(status='借用中').count()
-    available_devices = Device.query.filter_by(status='正常').count()
+    system_stats = current_stats()
     
     return render_template('dashboard.html', 
-                         total_devices=total_devices,
-                         active_borrows=active_borrows,
-                         available_devices=available_devices)
+                         total_devices=system_stats.devices.total,
+                         active_borrows=system_stats.borrows.active,
+                         available_devices=system_stats.devices.normal)
 
 
-@app.route('/device/add', methods=['GET', 'POST'])
+@bp.route('/device/add', methods=['GET', 'POST'])
 @login_required
 def add_device():
     if request.method == 'POST':
@@ -381,7 +488,7 @@ def add_device():
         existing_device = Device.query.filter_by(number=request.form.get('number')).first()
         if existing_device:
             flash('设备编号已存在！', 'danger')
-            return redirect(url_for('add_device'))
+            return redirect(url_for('main.add_device'))
         
         new_device = Device(
             name=request.form.get('name'),
@@ -396,13 +503,87 @@ def add_device():
         
         db.session.add(new_device)
         db.session.commit()
+        data_changed('device')
         
         flash('设备添加成功！', 'success')
-        return redirect(url_for('devices'))
+        return redirect(url_for('main.devices'))
     
     return render_template('add_device.html')
 
-@app.route('/device/edit/<int:device_id>', methods=['GET', 'POST'])
+# 导入结果页最多列出的错误行数，完整报告可用命令行导出
+IMPORT_ERRORS_SHOWN = 1000
+
+
+def _import_failed_message(error, report):
+    if not report.committed:
+        return f'导入失败：{error}'
+    return (f'导入中途失败：{error}。此前已导入 {report.committed} 行并已保存，'
+            f'修正文件后重新导入即可（已导入的设备按编号更新）')
+
+
+@bp.route('/device/import', methods=['GET', 'POST'])
+@login_required
+def import_devices():
+    """从 CSV/XLSX 文件批量导入设备（按设备编号新增或更新）"""
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('请选择要导入的文件！', 'danger')
+            return redirect(url_for('main.import_devices'))
+
+        dry_run = bool(request.form.get('dry_run'))
+        report = device_import.ImportReport()
+        try:
+            rows = device_import.read_rows(upload.stream, upload.filename)
+            device_import.import_devices(db.session, Device, rows, dry_run=dry_run, report=report)
+        except device_import.ImportFileError as e:
+            db.session.rollback()
+            flash(_import_failed_message(e, report), 'danger')
+            return redirect(url_for('main.import_devices'))
+        finally:
+            # 出错时之前的批次也已提交
+            if report.committed:
+                data_changed('device')
+
+        if request.args.get('format') == 'json':
+            return jsonify(report.to_dict())
+        return render_template('import_devices.html', report=report, dry_run=dry_run,
+                               errors=report.errors[:IMPORT_ERRORS_SHOWN])
+
+    return render_template('import_devices.html', report=None)
+
+
+@bp.cli.command('import-devices')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True, help='只校验，不写入数据库')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False),
+              help='把错误行写入该 CSV 文件')
+def import_devices_command(path, dry_run, errors_path):
+    """从 CSV/XLSX 文件批量导入设备"""
+    report = device_import.ImportReport()
+    with open(path, 'rb') as f:
+        try:
+            device_import.import_devices(db.session, Device, device_import.read_rows(f, path),
+                                         dry_run=dry_run, report=report)
+        except device_import.ImportFileError as e:
+            db.session.rollback()
+            raise click.ClickException(_import_failed_message(e, report))
+
+    action = '校验' if dry_run else '导入'
+    print(f"✓ {action}完成：共 {report.total} 行，新增 {report.inserted}，"
+          f"更新 {report.updated}，失败 {report.failed}")
+    if errors_path:
+        with open(errors_path, 'w', encoding='utf-8', newline='') as f:
+            f.writelines(stream_csv(['行号', '设备编号', '原因'], report.errors))
+        print(f"  错误报告已写入 {errors_path}")
+    else:
+        for line_no, number, message in report.errors[:20]:
+            print(f"  第 {line_no} 行 {number}: {message}")
+        if report.failed > 20:
+            print(f"  ……另有 {report.failed - 20} 行错误，可用 --errors 导出完整报告")
+
+
+@bp.route('/device/edit/<int:device_id>', methods=['GET', 'POST'])
 @login_required
 def edit_device(device_id):
     device = Device.query.get_or_404(device_id)
@@ -421,39 +602,159 @@ def edit_device(device_id):
         device.status = request.form.get('status')
         
         db.session.commit()
+        data_changed('device')
         flash('设备信息更新成功！', 'success')
-        return redirect(url_for('devices'))
+        return redirect(url_for('main.devices'))
     
     return render_template('edit_device.html', device=device)
 
-@app.route('/device/delete/<int:device_id>', methods=['POST'])
+@bp.route('/device/delete/<int:device_id>', methods=['POST'])
 @login_required
 def delete_device(device_id):
     if current_user.role != 'admin':
         flash('权限不足！', 'danger')
-        return redirect(url_for('devices'))
+        return redirect(url_for('main.devices'))
     
     device = Device.query.get_or_404(device_id)
     device_name = device.name
+
+    # 有人还等着用的预约不能随设备一起悄悄删掉；已结束、已取消的预约随设备删除
+    pending = Reservation.query.filter(Reservation.device_id == device.id,
+                                       Reservation.status == '有效',
+                                       Reservation.end_date >= datetime.now().date()).count()
+    if pending:
+        flash(f'设备 "{device_name}" 还有 {pending} 个未结束的有效预约，请先取消预约再删除！', 'danger')
+        return redirect(url_for('main.devices'))
     
+    # 留下删除记录，供增量同步识别
+    db.session.add(DeletedRecord(table_name='device', record_id=device.id, record_key=device.number))
     db.session.delete(device)
     db.session.commit()
+    data_changed()
     
     flash(f'设备 "{device_name}" 删除成功！', 'success')
-    return redirect(url_for('devices'))
+    return redirect(url_for('main.devices'))
 
 # ========== 借用归还路由 ==========
 
-@app.route('/borrow', methods=['GET', 'POST'])
+class BorrowConflict(Exception):
+    """设备或借用记录的状态已被其他请求改变"""
+
+
+class DeviceReserved(BorrowConflict):
+    """设备在借用期间已有他人的有效预约"""
+
+
+def borrow_window(record_fields):
+    """借用占用的时段；没有预计归还日期的视为一直占用"""
+    start = record_fields.get('borrow_date') or datetime.now().date()
+    return start, record_fields.get('expected_return_date') or date.max
+
+
+def reserved_by_others(start, end, reservation_id=None):
+    """设备在 [start, end] 内有有效预约（按预约借出时排除该预约本身）"""
+    condition = db.and_(Reservation.device_id == Device.id, reservation_overlaps(start, end))
+    if reservation_id is not None:
+        condition = db.and_(condition, Reservation.id != reservation_id)
+    return db.select(Reservation.id).where(condition).exists()
+
+
+def checkout_devices(device_ids, reservation_id=None, **record_fields):
+    """借出一批设备并为每台写入借用记录（调用方负责提交事务）
+
+    用一条带状态条件的 UPDATE 抢占全部设备，不先读后写；借用期间有他人有效预约的设备
+    同样不能借出（按预约借出时传入 reservation_id，排除该预约本身）。
+    只要有一台已被借出（包括被并发请求抢先）就抛出 BorrowConflict，有预约冲突时抛出
+    DeviceReserved，调用方回滚后整批都不会生效。
+    """
+    device_ids = list(dict.fromkeys(device_ids))
+    start, end = borrow_window(record_fields)
+    result = db.session.execute(
+        db.update(Device)
+        .where(Device.id.in_(device_ids), Device.status != '借用中',
+               ~reserved_by_others(start, end, reservation_id))
+        .values(status='借用中')
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(device_ids):
+        reserved = db.session.query(
+            Device.query.filter(Device.id.in_(device_ids),
+                                reserved_by_others(start, end, reservation_id)).exists()
+        ).scalar()
+        raise (DeviceReserved if reserved else BorrowConflict)(device_ids)
+
+    borrow_records = [BorrowRecord(device_id=device_id, status='借用中', **record_fields)
+                      for device_id in device_ids]
+    db.session.add_all(borrow_records)
+    # 补登以前日期的借用时，已汇总的日子要重算
+    refresh_utilization(device_ids, record_fields.get('borrow_date'))
+    return borrow_records
+
+
+def checkout_device(device_id, reservation_id=None, **record_fields):
+    """借出单台设备，见 checkout_devices"""
+    return checkout_devices([device_id], reservation_id=reservation_id, **record_fields)[0]
+
+
+def checkin_records(record_ids, return_date):
+    """归还一批借用记录对应的设备（调用方负责提交事务）
+
+    只有尚未归还（借用中或超期未还）的记录才能归还；有任何一条已归还（重复提交或并发归还）
+    就抛出 BorrowConflict，调用方回滚后整批都不会生效。
+    """
+    record_ids = list(dict.fromkeys(record_ids))
+    result = db.session.execute(
+        db.update(BorrowRecord)
+        .where(BorrowRecord.id.in_(record_ids), BorrowRecord.status.in_(ACTIVE_BORROW_STATUSES))
+        .values(status='已归还', actual_return_date=return_date)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(record_ids):
+        raise BorrowConflict(record_ids)
+
+    device_ids = db.select(BorrowRecord.device_id).where(BorrowRecord.id.in_(record_ids))
+    db.session.execute(
+        db.update(Device)
+        .where(Device.id.in_(device_ids), Device.status == '借用中')
+        .values(status='正常')
+        .execution_options(synchronize_session=False)
+    )
+    refresh_utilization(device_ids, return_date)
+
+
+def checkin_record(record_id, return_date):
+    """归还单条借用记录，见 checkin_records"""
+    checkin_records([record_id], return_date)
+
+
+def unavailable_devices(device_ids, device_numbers=(), start=None, end=None):
+    """一条查询找出不能借出的设备
+
+    返回 (可借设备ID列表, 不可借原因列表)；原因包括已被借用、[start, end] 内已被预约
+    和编号/ID不存在。
+    """
+    start = start or datetime.now().date()
+    end = end or date.max
+    rows = db.session.query(Device, reserved_by_others(start, end)).filter(
+        Device.id.in_(device_ids) | Device.number.in_(device_numbers)
+    ).all()
+    borrowed = [d for d, _ in rows if d.status == '借用中']
+    reserved = [d for d, is_reserved in rows if is_reserved and d.status != '借用中']
+    problems = [f'{d.name}（{d.number}）已被借用' for d in borrowed]
+    problems += [f'{d.name}（{d.number}）在借用期间已被预约' for d in reserved]
+    found_ids = {d.id for d, _ in rows}
+    found_numbers = {d.number for d, _ in rows}
+    problems += [f'设备ID {i} 不存在' for i in device_ids if i not in found_ids]
+    problems += [f'设备编号 {n} 不存在' for n in device_numbers if n not in found_numbers]
+    available = [d.id for d, is_reserved in rows if d.status != '借用中' and not is_reserved]
+    return available, problems
+
+
+@bp.route('/borrow', methods=['GET', 'POST'])
 @login_required
 def borrow_device():
     if request.method == 'POST':
-        device_id = request.form.get('device_id')
-        device = Device.query.get_or_404(device_id)
-        
-        if device.status == '借用中':
-            flash('该设备已被借用！', 'danger')
-            return redirect(url_for('borrow_device'))
+        device_id = request.form.get('device_id', type=int)
         
         try:
             borrow_date = datetime.strptime(
@@ -463,72 +764,601 @@ def borrow_device():
         except:
             borrow_date = datetime.now().date()
         
-        borrow_record = BorrowRecord(
-            device_id=device_id,
-            borrower_name=request.form.get('borrower_name'),
-            borrower_department=request.form.get('borrower_department'),
-            borrower_contact=request.form.get('borrower_contact'),
-            borrow_date=borrow_date,
-            borrow_purpose=request.form.get('borrow_purpose'),
-            status='借用中'
-        )
-        
-        device.status = '借用中'
-        
-        db.session.add(borrow_record)
-        db.session.commit()
+        try:
+            checkout_device(
+                device_id,
+                borrower_name=request.form.get('borrower_name'),
+                borrower_department=request.form.get('borrower_department'),
+                borrower_contact=request.form.get('borrower_contact'),
+                borrow_date=borrow_date,
+                expected_return_date=_parse_form_date('expected_return_date'),
+                borrow_purpose=request.form.get('borrow_purpose')
+            )
+            db.session.commit()
+        except DeviceReserved:
+            db.session.rollback()
+            flash('该设备在借用期间已被预约，请按预约借出或选择其他设备！', 'danger')
+            return redirect(url_for('main.borrow_device'))
+        except BorrowConflict:
+            db.session.rollback()
+            Device.query.get_or_404(device_id)
+            flash('该设备已被借用！', 'danger')
+            return redirect(url_for('main.borrow_device'))
+        data_changed('device', 'borrow_record')
         
         flash('设备借用成功！', 'success')
-        return redirect(url_for('borrow_records'))
+        return redirect(url_for('main.borrow_records'))
     
     available_devices = Device.query.filter(Device.status != '借用中').all()
     return render_template('borrow.html', devices=available_devices)
 
-@app.route('/return', methods=['GET', 'POST'])
+@bp.route('/return', methods=['GET', 'POST'])
 @login_required
 def return_device():
     if request.method == 'POST':
-        record_id = request.form.get('record_id')
-        borrow_record = BorrowRecord.query.get_or_404(record_id)
-        
-        borrow_record.actual_return_date = datetime.now().date()
-        borrow_record.status = '已归还'
+        record_id = request.form.get('record_id', type=int)
         
-        device = borrow_record.device
-        device.status = '正常'
-        
-        db.session.commit()
+        try:
+            checkin_record(record_id, datetime.now().date())
+            db.session.commit()
+        except BorrowConflict:
+            db.session.rollback()
+            BorrowRecord.query.get_or_404(record_id)
+            flash('该借用记录已归还！', 'warning')
+            return redirect(url_for('main.return_device'))
+        data_changed('device', 'borrow_record')
         flash('设备归还成功！', 'success')
-        return redirect(url_for('borrow_records'))
+        return redirect(url_for('main.borrow_records'))
     
-    active_records = BorrowRecord.query.filter_by(status='借用中').all()
+    # 设备名称随记录一起联接查询，避免每条记录再查一次设备
+    active_records = (BorrowRecord.query
+                      .options(db.joinedload(BorrowRecord.device))
+                      .filter(BorrowRecord.status.in_(ACTIVE_BORROW_STATUSES))
+                      .all())
     return render_template('return.html', records=active_records)
 
-@app.route('/borrow/records')
+@bp.route('/borrow/batch', methods=['GET', 'POST'])
+@login_required
+def borrow_batch():
+    """批量借用：整批设备在一个事务里借出，有不可借的设备时整批不生效"""
+    if request.method == 'POST':
+        device_ids = request.form.getlist('device_ids', type=int)
+        # 也支持直接输入/扫码录入设备编号，每行一个
+        device_numbers = [n.strip() for n in request.form.get('device_numbers', '').splitlines()
+                          if n.strip()]
+        device_numbers = list(dict.fromkeys(device_numbers))
+
+        if not device_ids and not device_numbers:
+            flash('请至少选择一台设备！', 'danger')
+            return redirect(url_for('main.borrow_batch'))
+
+        try:
+            borrow_date = datetime.strptime(
+                request.form.get('borrow_date'),
+                '%Y-%m-%d'
+            ).date()
+        except:
+            borrow_date = datetime.now().date()
+
+        record_fields = dict(
+            borrower_name=request.form.get('borrower_name'),
+            borrower_department=request.form.get('borrower_department'),
+            borrower_contact=request.form.get('borrower_contact'),
+            borrow_date=borrow_date,
+            expected_return_date=_parse_form_date('expected_return_date'),
+            borrow_purpose=request.form.get('borrow_purpose')
+        )
+
+        start, end = borrow_window(record_fields)
+        available, problems = unavailable_devices(device_ids, device_numbers, start, end)
+        if not problems:
+            try:
+                checkout_devices(available, **record_fields)
+                db.session.commit()
+            except BorrowConflict:
+                # 校验之后又被其他请求抢先借出或预约，重新查出具体是哪些设备
+                db.session.rollback()
+                _, problems = unavailable_devices(available, start=start, end=end)
+
+        if problems:
+            flash('以下设备无法借用，本次批量借用未生效：' + '；'.join(problems), 'danger')
+            return redirect(url_for('main.borrow_batch'))
+
+        data_changed('device', 'borrow_record')
+        flash(f'批量借用成功，共借出 {len(available)} 台设备！', 'success')
+        return redirect(url_for('main.borrow_records'))
+
+    available_devices = Device.query.filter(Device.status != '借用中').all()
+    return render_template('borrow_batch.html', devices=available_devices)
+
+
+@bp.route('/return/batch', methods=['GET', 'POST'])
+@login_required
+def return_batch():
+    """批量归还：整批记录在一个事务里归还，有已归还的记录时整批不生效"""
+    if request.method == 'POST':
+        record_ids = request.form.getlist('record_ids', type=int)
+        if not record_ids:
+            flash('请至少选择一条借用记录！', 'danger')
+            return redirect(url_for('main.return_batch'))
+
+        try:
+            checkin_records(record_ids, datetime.now().date())
+            db.session.commit()
+        except BorrowConflict:
+            db.session.rollback()
+            still_active = {r.id for r in BorrowRecord.query
+                            .filter(BorrowRecord.id.in_(record_ids),
+                                    BorrowRecord.status.in_(ACTIVE_BORROW_STATUSES))
+                            .with_entities(BorrowRecord.id)}
+            problems = [str(i) for i in record_ids if i not in still_active]
+            flash('以下借用记录已归还或不存在，本次批量归还未生效：记录ID ' + '、'.join(problems), 'danger')
+            return redirect(url_for('main.return_batch'))
+
+        data_changed('device', 'borrow_record')
+        flash(f'批量归还成功，共归还 {len(set(record_ids))} 台设备！', 'success')
+        return redirect(url_for('main.borrow_records'))
+
+    # 设备名称随记录一起联接查询，避免每条记录再查一次设备
+    active_records = (BorrowRecord.query
+                      .options(db.joinedload(BorrowRecord.device))
+                      .filter(BorrowRecord.status.in_(ACTIVE_BORROW_STATUSES))
+                      .all())
+    return render_template('return_batch.html', records=active_records)
+
+
+BORROW_RECORDS_PER_PAGE = 50
+
+
+def _parse_date_arg(name):
+    """读取 YYYY-MM-DD 格式的查询参数，无效时返回 None"""
+    value = request.args.get(name, '')
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def _parse_form_date(name):
+    """读取 YYYY-MM-DD 格式的表单字段，未填或无效时返回 None"""
+    value = request.form.get(name, '')
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+@bp.route('/borrow/records')
 @login_required
 def borrow_records():
-    records = BorrowRecord.query.order_by(BorrowRecord.created_at.desc()).all()
-    active_records = BorrowRecord.query.filter_by(status='借用中').count()
-    returned_records = BorrowRecord.query.filter_by(status='已归还').count()
-    
+    status = request.args.get('status', '')
+    borrower = request.args.get('borrower', '').strip()
+    device = request.args.get('device', '').strip()
+    device_id = request.args.get('device_id', type=int)
+    date_from = _parse_date_arg('date_from')
+    date_to = _parse_date_arg('date_to')
+    cursor = request.args.get('cursor', '')
+
+    # 设备名称随记录一起联接查询，避免每条记录再查一次设备
+    query = BorrowRecord.query.options(db.joinedload(BorrowRecord.device))
+
+    if status:
+        query = query.filter(BorrowRecord.status == status)
+
+    if borrower:
+        query = query.filter(
+            (BorrowRecord.borrower_name.contains(borrower)) |
+            (BorrowRecord.borrower_department.contains(borrower))
+        )
+
+    if device_id:
+        query = query.filter(BorrowRecord.device_id == device_id)
+    elif device:
+        matching_devices = db.select(Device.id).where(
+            (Device.name.contains(device)) | (Device.number.contains(device))
+        )
+        query = query.filter(BorrowRecord.device_id.in_(matching_devices))
+
+    if date_from:
+        query = query.filter(BorrowRecord.borrow_date >= date_from)
+    if date_to:
+        query = query.filter(BorrowRecord.borrow_date <= date_to)
+
+    record_stats = current_stats().borrows
+
+    filters = {
+        'status': status,
+        'borrower': borrower,
+        'device': device,
+        'device_id': device_id or '',
+        'date_from': date_from.strftime('%Y-%m-%d') if date_from else '',
+        'date_to': date_to.strftime('%Y-%m-%d') if date_to else '',
+    }
+
+    def render_table():
+        # 按 (创建时间, id) 倒序做键集分页
+        page = keyset_paginate(query,
+                               BorrowRecord.created_at,
+                               BorrowRecord.id,
+                               cursor=cursor,
+                               per_page=BORROW_RECORDS_PER_PAGE,
+                               descending=True)
+        return Markup(render_template('borrow_records_table.html',
+                                      records=page.items, page=page, filters=filters))
+
+    # 表格里有设备名称和编号，设备数据变化时也要失效
+    records_table = fragment_cache().get_or_render(
+        ('borrow_record', 'device'), ('borrow_records', cursor) + tuple(filters.values()), render_table)
+
     return render_template('borrow_records.html', 
-                         records=records,
-                         active_records=active_records,
-                         returned_records=returned_records)
+                         records_table=records_table,
+                         filters=filters,
+                         active_records=record_stats.active,
+                         returned_records=record_stats.returned)
+
+# ========== 超期管理 ==========
+
+OVERDUE_PER_PAGE = 50
+
+
+def overdue_query(today=None):
+    """未归还且已过预计归还日期的借用记录
+
+    条件落在 (status, expected_return_date) 复合索引上，只读取超期的行。
+    """
+    today = today or datetime.now().date()
+    return BorrowRecord.query.filter(
+        BorrowRecord.status.in_(ACTIVE_BORROW_STATUSES),
+        BorrowRecord.expected_return_date < today
+    )
+
+
+def sweep_overdue(today=None):
+    """把已过预计归还日期的借用中记录批量标记为超期未还，返回标记的条数（调用方负责提交事务）"""
+    today = today or datetime.now().date()
+    result = db.session.execute(
+        db.update(BorrowRecord)
+        .where(BorrowRecord.status == '借用中', BorrowRecord.expected_return_date < today)
+        .values(status='超期未还')
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+@bp.cli.command('sweep-overdue')
+def sweep_overdue_command():
+    """标记超期未还的借用记录（flask maintenance 会按 MAINTENANCE_OVERDUE_INTERVAL 定期执行）"""
+    count = sweep_overdue()
+    db.session.commit()
+    if count:
+        data_changed('borrow_record')
+    print(f"✓ 已将 {count} 条借用记录标记为超期未还")
+
+
+def _overdue_page():
+    today = datetime.now().date()
+    query = overdue_query(today).options(db.joinedload(BorrowRecord.device))
+    # 最早到期（超期最久）的排在前面
+    page = keyset_paginate(query,
+                           BorrowRecord.expected_return_date,
+                           BorrowRecord.id,
+                           cursor=request.args.get('cursor', ''),
+                           per_page=OVERDUE_PER_PAGE)
+    return page, today
+
+
+@bp.route('/borrow/overdue')
+@login_required
+def overdue_records():
+    """超期未还的借用记录"""
+    page, today = _overdue_page()
+    return render_template('overdue.html', records=page.items, page=page, today=today)
+
+
+@bp.route('/api/overdue')
+@login_required
+def api_overdue():
+    """超期未还的借用记录（JSON，按 next_cursor 翻页）"""
+    page, today = _overdue_page()
+    items = []
+    for record in page.items:
+        item = record.to_dict()
+        item['device_name'] = record.device.name
+        item['device_number'] = record.device.number
+        item['overdue_days'] = (today - record.expected_return_date).days
+        items.append(item)
+    return jsonify({'items': items, 'next_cursor': page.next_cursor})
+
+
+# ========== 设备预约 ==========
+
+# 日历接口一次最多查询的设备数和天数
+CALENDAR_MAX_DEVICES = 500
+CALENDAR_MAX_DAYS = 366
+
+
+class ReservationConflict(Exception):
+    """预约时段与已有预约或借用冲突"""
+
+
+def reservation_overlaps(start, end):
+    """与 [start, end] 重叠的有效预约
+
+    start_date 的下界由最长预约天数推出，查询只扫描索引上的一小段。
+    """
+    return db.and_(
+        Reservation.start_date <= end,
+        Reservation.start_date >= start - timedelta(days=MAX_RESERVATION_DAYS - 1),
+        Reservation.end_date >= start,
+        Reservation.status == '有效'
+    )
+
+
+def borrow_overlaps(start, end):
+    """占用 [start, end] 的未归还借用记录
+
+    没有预计归还日期或已经超期的，视为一直占用到归还为止。
+    """
+    today = datetime.now().date()
+    return db.and_(
+        BorrowRecord.status.in_(ACTIVE_BORROW_STATUSES),
+        BorrowRecord.borrow_date <= end,
+        db.or_(BorrowRecord.expected_return_date.is_(None),
+               BorrowRecord.expected_return_date >= start,
+               BorrowRecord.expected_return_date < today)
+    )
+
+
+def available_devices_query(start, end):
+    """在 [start, end] 内既无预约也未被借出、且不在维修中的设备"""
+    reserved = db.select(Reservation.id).where(
+        Reservation.device_id == Device.id, reservation_overlaps(start, end))
+    borrowed = db.select(BorrowRecord.id).where(
+        BorrowRecord.device_id == Device.id, borrow_overlaps(start, end))
+    return Device.query.filter(
+        ~reserved.exists(), ~borrowed.exists(), Device.status != '维修中')
+
+
+def reserve_device(device_id, start, end, **fields):
+    """预约设备（调用方负责提交事务），返回新预约的ID
+
+    冲突检查和插入在同一条 INSERT ... SELECT ... WHERE NOT EXISTS 里完成，
+    两个请求同时预约同一时段时只有一个能成功，另一个抛出 ReservationConflict。
+    """
+    reserved = db.select(Reservation.id).where(
+        Reservation.device_id == device_id, reservation_overlaps(start, end))
+    borrowed = db.select(BorrowRecord.id).where(
+        BorrowRecord.device_id == device_id, borrow_overlaps(start, end))
+
+    values = dict(device_id=device_id, start_date=start, end_date=end, status='有效', **fields)
+    columns = list(values)
+    source = db.select(*[db.literal(values[name], Reservation.__table__.c[name].type)
+                         for name in columns])
+    source = source.where(
+        db.exists(db.select(Device.id).where(Device.id == device_id)),
+        ~reserved.exists(),
+        ~borrowed.exists()
+    )
+    result = db.session.execute(
+        db.insert(Reservation).from_select(columns, source)
+    )
+    if result.rowcount != 1:
+        raise ReservationConflict(device_id)
+    return result.lastrowid
+
+
+def _reservation_window(start_name='start', end_name='end'):
+    """读取并校验查询参数中的预约时段，无效时返回 (None, None)"""
+    start = _parse_date_arg(start_name)
+    end = _parse_date_arg(end_name)
+    if not start or not end or end < start:
+        return None, None
+    return start, end
+
+
+@bp.route('/reservations')
+@login_required
+def reservations():
+    """预约列表，以及按型号和时段查询空闲设备"""
+    today = datetime.now().date()
+    upcoming = (Reservation.query
+                .options(db.joinedload(Reservation.device))
+                .filter(Reservation.status == '有效', Reservation.end_date >= today)
+                .order_by(Reservation.start_date, Reservation.id)
+                .limit(200)
+                .all())
+
+    model = request.args.get('model', '').strip()
+    start, end = _reservation_window()
+    free_devices = None
+    if start:
+        query = available_devices_query(start, end)
+        if model:
+            query = query.filter(Device.model == model)
+        free_devices = query.order_by(Device.name, Device.id).limit(200).all()
+
+    return render_template('reservations.html',
+                           reservations=upcoming,
+                           free_devices=free_devices,
+                           model=model,
+                           start=start,
+                           end=end,
+                           max_days=MAX_RESERVATION_DAYS)
+
+
+@bp.route('/reservation/add', methods=['POST'])
+@login_required
+def add_reservation():
+    """预约设备"""
+    device_id = request.form.get('device_id', type=int)
+    start = _parse_form_date('start_date')
+    end = _parse_form_date('end_date')
+
+    if not start or not end or end < start:
+        flash('请填写有效的预约起止日期！', 'danger')
+        return redirect(url_for('main.reservations'))
+    if (end - start).days + 1 > MAX_RESERVATION_DAYS:
+        flash(f'单次预约不能超过 {MAX_RESERVATION_DAYS} 天！', 'danger')
+        return redirect(url_for('main.reservations'))
+    if start < datetime.now().date():
+        flash('不能预约过去的日期！', 'danger')
+        return redirect(url_for('main.reservations'))
+
+    try:
+        reserve_device(
+            device_id, start, end,
+            borrower_name=request.form.get('borrower_name') or current_user.username,
+            borrower_department=request.form.get('borrower_department'),
+            purpose=request.form.get('purpose'),
+            created_by=current_user.id
+        )
+        db.session.commit()
+    except ReservationConflict:
+        db.session.rollback()
+        Device.query.get_or_404(device_id)
+        flash('该设备在所选时段已被预约或借出！', 'danger')
+        return redirect(url_for('main.reservations'))
+
+    flash('设备预约成功！', 'success')
+    return redirect(url_for('main.reservations'))
+
+
+@bp.route('/reservation/cancel/<int:reservation_id>', methods=['POST'])
+@login_required
+def cancel_reservation(reservation_id):
+    """取消预约"""
+    reservation = Reservation.query.get_or_404(reservation_id)
+    if reservation.created_by != current_user.id and current_user.role != 'admin':
+        flash('权限不足！', 'danger')
+        return redirect(url_for('main.reservations'))
+
+    db.session.execute(
+        db.update(Reservation)
+        .where(Reservation.id == reservation_id, Reservation.status == '有效')
+        .values(status='已取消')
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    flash('预约已取消', 'success')
+    return redirect(url_for('main.reservations'))
+
+
+@bp.route('/reservation/checkout/<int:reservation_id>', methods=['POST'])
+@login_required
+def checkout_reservation(reservation_id):
+    """按预约借出设备，借用记录与预约关联"""
+    reservation = Reservation.query.get_or_404(reservation_id)
+    if reservation.status != '有效':
+        flash('该预约已取消或已借出！', 'danger')
+        return redirect(url_for('main.reservations'))
+
+    try:
+        borrow_record = checkout_device(
+            reservation.device_id,
+            reservation_id=reservation_id,
+            borrower_name=reservation.borrower_name,
+            borrower_department=reservation.borrower_department,
+            borrow_date=datetime.now().date(),
+            expected_return_date=reservation.end_date,
+            borrow_purpose=reservation.purpose
+        )
+        db.session.flush()
+        result = db.session.execute(
+            db.update(Reservation)
+            .where(Reservation.id == reservation_id, Reservation.status == '有效')
+            .values(status='已借出', borrow_record_id=borrow_record.id)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            raise BorrowConflict(reservation_id)
+        db.session.commit()
+    except BorrowConflict:
+        db.session.rollback()
+        flash('该设备已被借用！', 'danger')
+        return redirect(url_for('main.reservations'))
+    data_changed('device', 'borrow_record')
+
+    flash('已按预约借出设备！', 'success')
+    return redirect(url_for('main.borrow_records'))
+
+
+@bp.route('/api/reservations/calendar')
+@login_required
+def api_reservation_calendar():
+    """多台设备在某时段内的占用情况
+
+    参数：start、end（YYYY-MM-DD），device_ids（逗号分隔）或 model。
+    不论设备多少，预约和借用各只查一次。
+    """
+    start, end = _reservation_window()
+    if not start:
+        return jsonify({'success': False, 'message': '请提供有效的 start 和 end 日期'}), 400
+    if (end - start).days + 1 > CALENDAR_MAX_DAYS:
+        return jsonify({'success': False, 'message': f'查询时段不能超过 {CALENDAR_MAX_DAYS} 天'}), 400
+
+    query = Device.query
+    model = request.args.get('model', '').strip()
+    if model:
+        query = query.filter(Device.model == model)
+    else:
+        try:
+            device_ids = [int(i) for i in request.args.get('device_ids', '').split(',') if i.strip()]
+        except ValueError:
+            return jsonify({'success': False, 'message': 'device_ids 格式错误'}), 400
+        query = query.filter(Device.id.in_(device_ids))
+    devices_list = query.order_by(Device.id).limit(CALENDAR_MAX_DEVICES).all()
+    device_ids = [d.id for d in devices_list]
+
+    calendar = {
+        d.id: {'id': d.id, 'name': d.name, 'number': d.number, 'model': d.model,
+               'status': d.status, 'busy': []}
+        for d in devices_list
+    }
+
+    if device_ids:
+        for r in (Reservation.query
+                  .filter(Reservation.device_id.in_(device_ids), reservation_overlaps(start, end))
+                  .order_by(Reservation.start_date)):
+            calendar[r.device_id]['busy'].append({
+                'type': 'reservation',
+                'id': r.id,
+                'start': r.start_date.strftime('%Y-%m-%d'),
+                'end': r.end_date.strftime('%Y-%m-%d'),
+                'borrower_name': r.borrower_name
+            })
+        for b in (BorrowRecord.query
+                  .filter(BorrowRecord.device_id.in_(device_ids), borrow_overlaps(start, end))):
+            calendar[b.device_id]['busy'].append({
+                'type': 'borrow',
+                'id': b.id,
+                'start': b.borrow_date.strftime('%Y-%m-%d'),
+                'end': b.expected_return_date.strftime('%Y-%m-%d') if b.expected_return_date else None,
+                'borrower_name': b.borrower_name
+            })
+
+    for item in calendar.values():
+        item['available'] = not item['busy'] and item['status'] != '维修中'
+
+    return jsonify({
+        'start': start.strftime('%Y-%m-%d'),
+        'end': end.strftime('%Y-%m-%d'),
+        'devices': list(calendar.values())
+    })
+
 
 # ========== 用户管理路由 ==========
 
-@app.route('/users')
+@bp.route('/users')
 @login_required
 def users():
     if current_user.role != 'admin':
         flash('权限不足！', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     users_list = User.query.all()
     return render_template('users.html', users=users_list)
 
-@app.route('/user/add', methods=['POST'])
+@bp.route('/user/add', methods=['POST'])
 @login_required
 def add_user():
     if current_user.role != 'admin':
@@ -541,7 +1371,7 @@ def add_user():
     # 检查用户名是否已存在
     if User.query.filter_by(username=username).first():
         flash('用户名已存在！', 'danger')
-        return redirect(url_for('users'))
+        return redirect(url_for('main.users'))
     
     new_user = User(
         username=username,
@@ -555,131 +1385,324 @@ def add_user():
     db.session.commit()
     
     flash('用户添加成功！', 'success')
-    return redirect(url_for('users'))
+    return redirect(url_for('main.users'))
 
 
 # ========== 导出功能路由 ==========
 
-@app.route('/export/devices')
+EXPORT_BATCH_SIZE = 1000
+
+
+def _parse_since_arg():
+    """解析增量同步的 since 参数（UTC 时间，ISO 格式）
+
+    未提供时返回 None，格式错误时抛出 ValueError。
+    """
+    value = request.args.get('since', '').strip()
+    if not value:
+        return None
+    since = datetime.fromisoformat(value)
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+
+def _since_error():
+    return jsonify({
+        'success': False,
+        'message': 'since 参数格式错误，应为 UTC 时间，如 2024-01-01T00:00:00'
+    }), 400
+
+
+@bp.route('/export/devices')
 @login_required
 def export_devices():
-    """导出设备数据为CSV"""
-    devices = Device.query.all()
-
-    # 创建CSV内容
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    # 写入表头
-    writer.writerow(['设备名称', '设备编号', '设备型号', '设备信息', '校准日期',
-                     '所在地', '管理人', '状态', '创建时间'])
-
-    # 写入数据
-    for device in devices:
-        writer.writerow([
-            device.name,
-            device.number,
-            device.model or '',
-            device.info or '',
-            device.calibration_date.strftime('%Y-%m-%d'),
-            device.location or '',
-            device.manager or '',
-            device.status,
-            device.created_at.strftime('%Y-%m-%d %H:%M:%S')
-        ])
-
-    output.seek(0)
-
-    # 返回CSV文件
+    """导出设备数据为CSV（分批查询，边查边输出）
+
+    带 since 参数时只导出该时间之后新增或修改过的设备。
+    """
+    try:
+        since = _parse_since_arg()
+    except ValueError:
+        return _since_error()
+
+    # 只查导出需要的列，不构造 ORM 对象
+    query = db.session.query(
+        Device.name, Device.number, Device.model, Device.info,
+        Device.calibration_date, Device.location, Device.manager,
+        Device.status, Device.created_at
+    )
+    if since:
+        query = query.filter(Device.updated_at >= since)
+
+    header = ['设备名称', '设备编号', '设备型号', '设备信息', '校准日期',
+              '所在地', '管理人', '状态', '创建时间']
+
+    def generate_rows():
+        for device in iter_keyset_batches(query, Device.id, EXPORT_BATCH_SIZE):
+            yield [
+                device.name,
+                device.number,
+                device.model or '',
+                device.info or '',
+                device.calibration_date.strftime('%Y-%m-%d'),
+                device.location or '',
+                device.manager or '',
+                device.status,
+                device.created_at.strftime('%Y-%m-%d %H:%M:%S') if device.created_at else ''
+            ]
+
+    # 返回CSV文件（流式响应）
     return Response(
-        output.getvalue(),
+        stream_with_context(stream_csv(header, generate_rows())),
         mimetype='text/csv',
         headers={'Content-Disposition': 'attachment; filename=devices.csv'}
     )
 
 
-@app.route('/export/borrow_records')
+@bp.route('/export/borrow_records')
 @login_required
 def export_borrow_records():
-    """导出借用记录为CSV"""
-    records = BorrowRecord.query.all()
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    # 写入表头
-    writer.writerow(['设备名称', '设备编号', '借用人', '所在部门', '联系方式',
-                     '借用日期', '预计归还', '实际归还', '借用用途', '状态'])
-
-    # 写入数据
-    for record in records:
-        writer.writerow([
-            record.device.name,
-            record.device.number,
-            record.borrower_name,
-            record.borrower_department or '',
-            record.borrower_contact or '',
-            record.borrow_date.strftime('%Y-%m-%d'),
-            record.expected_return_date.strftime('%Y-%m-%d') if record.expected_return_date else '',
-            record.actual_return_date.strftime('%Y-%m-%d') if record.actual_return_date else '',
-            record.borrow_purpose or '',
-            record.status
-        ])
-
-    output.seek(0)
+    """导出借用记录为CSV（分批查询，边查边输出）
+
+    带 since 参数时只导出该时间之后新增或修改过的借用记录。
+    """
+    try:
+        since = _parse_since_arg()
+    except ValueError:
+        return _since_error()
+
+    # 设备名称、编号随记录一起联接查询，避免每条记录再查一次设备
+    query = db.session.query(
+        Device.name.label('device_name'), Device.number.label('device_number'),
+        BorrowRecord.borrower_name, BorrowRecord.borrower_department,
+        BorrowRecord.borrower_contact, BorrowRecord.borrow_date,
+        BorrowRecord.expected_return_date, BorrowRecord.actual_return_date,
+        BorrowRecord.borrow_purpose, BorrowRecord.status
+    ).join(BorrowRecord.device)
+    if since:
+        query = query.filter(BorrowRecord.updated_at >= since)
+
+    header = ['设备名称', '设备编号', '借用人', '所在部门', '联系方式',
+              '借用日期', '预计归还', '实际归还', '借用用途', '状态']
+
+    def generate_rows():
+        for record in iter_keyset_batches(query, BorrowRecord.id, EXPORT_BATCH_SIZE):
+            yield [
+                record.device_name,
+                record.device_number,
+                record.borrower_name,
+                record.borrower_department or '',
+                record.borrower_contact or '',
+                record.borrow_date.strftime('%Y-%m-%d'),
+                record.expected_return_date.strftime('%Y-%m-%d') if record.expected_return_date else '',
+                record.actual_return_date.strftime('%Y-%m-%d') if record.actual_return_date else '',
+                record.borrow_purpose or '',
+                record.status
+            ]
 
     return Response(
-        output.getvalue(),
+        stream_with_context(stream_csv(header, generate_rows())),
         mimetype='text/csv',
         headers={'Content-Disposition': 'attachment; filename=borrow_records.csv'}
     )
 
 
+# ========== 设备使用率 ==========
+
+UTILIZATION_STATE_KEY = 'utilization_rolled_through'
+UTILIZATION_DEFAULT_DAYS = 365
+UTILIZATION_MAX_DAYS = 3660
+
+
+def utilization_rolled_through():
+    """日汇总已完成到哪一天（含），尚未汇总过时返回 None"""
+    value = get_state(UTILIZATION_STATE_KEY)
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def refresh_utilization(device_ids, since):
+    """借用/归还写入后，重算这些设备从 since 起已汇总过的日子（调用方负责提交事务）
+
+    正常借还发生在当天，而汇总只到昨天，通常什么都不用做；
+    只有补登以前日期的借用或归还时才会重算。
+    """
+    done = utilization_rolled_through()
+    if done is None or since is None or since > done:
+        return
+    db.session.flush()
+    utilization.rollup(db.session, BorrowRecord, DeviceUsageDaily, since, done, device_ids)
+
+
+def update_utilization(since=None, today=None):
+    """把日汇总补到昨天，返回 (重算起始日, 写入行数)
+
+    首次运行时从最早的借用日期开始回填；since 指定时从该日起重算。
+    """
+    today = today or datetime.now().date()
+    yesterday = today - timedelta(days=1)
+    done = utilization_rolled_through()
+    if done is None:
+        start = db.session.query(db.func.min(BorrowRecord.borrow_date)).scalar() or today
+    else:
+        start = done + timedelta(days=1)
+    if since is not None:
+        start = min(start, since)
+
+    count = utilization.rollup(db.session, BorrowRecord, DeviceUsageDaily, start, yesterday)
+    if done is None or done < yesterday:
+        set_state(UTILIZATION_STATE_KEY, yesterday.strftime('%Y-%m-%d'))
+    db.session.commit()
+    return start, count
+
+
+@bp.cli.command('rollup-utilization')
+@click.option('--since', help='从该日期（YYYY-MM-DD）起重算，默认只补上次汇总之后的日子')
+@click.option('--full', is_flag=True, help='从最早的借用记录起全部重算')
+def rollup_utilization_command(since, full):
+    """更新设备使用率日汇总（可由 cron 每天调用，也用于回填历史数据）"""
+    if full:
+        since = db.session.query(db.func.min(BorrowRecord.borrow_date)).scalar()
+    elif since:
+        try:
+            since = datetime.strptime(since, '%Y-%m-%d').date()
+        except ValueError:
+            raise click.BadParameter('日期格式应为 YYYY-MM-DD', param_hint='--since')
+    start, count = update_utilization(since=since)
+    print(f"✓ 使用率日汇总已更新到 {utilization_rolled_through()}"
+          f"（自 {start} 起重算，写入 {count} 行）")
+
+
+def _utilization_report():
+    """按请求参数生成使用率报表，参数无效时返回错误信息
+
+    只读取已有的日汇总，不在请求里做汇总（由 flask rollup-utilization 或 flask maintenance 完成），
+    报表注明汇总截至哪一天。
+    """
+    rolled_through = utilization_rolled_through()
+    if rolled_through is None:
+        return None, '使用率尚未汇总，请执行 flask rollup-utilization 或启动 flask maintenance'
+
+    group_by = request.args.get('group_by', 'device')
+    if group_by not in utilization.GROUP_BY_CHOICES:
+        return None, 'group_by 只能是 device、model 或 location'
+
+    end = _parse_date_arg('end') or rolled_through
+    end = min(end, rolled_through)
+    start = _parse_date_arg('start') or end - timedelta(days=UTILIZATION_DEFAULT_DAYS - 1)
+    if start > end:
+        return None, f'开始日期不能晚于结束日期（汇总数据截至 {rolled_through}）'
+    if (end - start).days + 1 > UTILIZATION_MAX_DAYS:
+        return None, f'查询时段不能超过 {UTILIZATION_MAX_DAYS} 天'
+
+    rows = utilization.utilization_report(db.session, Device, DeviceUsageDaily,
+                                          start, end, group_by)
+    return {
+        'start': start.strftime('%Y-%m-%d'),
+        'end': end.strftime('%Y-%m-%d'),
+        'group_by': group_by,
+        'rolled_through': rolled_through.strftime('%Y-%m-%d'),
+        'stale': rolled_through < datetime.now().date() - timedelta(days=1),
+        'rows': rows
+    }, None
+
+
+@bp.route('/reports/utilization')
+@login_required
+def utilization_report():
+    """设备使用率报表（按设备、型号或地点）"""
+    report, error = _utilization_report()
+    if error:
+        flash(error, 'danger')
+    return render_template('utilization.html', report=report,
+                           group_by=request.args.get('group_by', 'device'))
+
+
+@bp.route('/api/utilization')
+@login_required
+def api_utilization():
+    """设备使用率（JSON）
+
+    参数：start、end（YYYY-MM-DD，默认截至汇总完成日的一年），group_by（device/model/location）。
+    rolled_through 为日汇总完成到的日期，stale 为真表示汇总没有跟上到昨天。
+    """
+    report, error = _utilization_report()
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    return jsonify(report)
+
+
 # ========== 统计API路由 ==========
 
-@app.route('/api/stats')
+@bp.route('/api/stats')
 @login_required
 def api_stats():
     """获取系统统计数据"""
-    # 设备统计
-    total_devices = Device.query.count()
-    normal_devices = Device.query.filter_by(status='正常').count()
-    borrowed_devices = Device.query.filter_by(status='借用中').count()
-    maintenance_devices = Device.query.filter_by(status='维修中').count()
-
-    # 借用统计
-    total_borrows = BorrowRecord.query.count()
-    active_borrows = BorrowRecord.query.filter_by(status='借用中').count()
-    returned_borrows = BorrowRecord.query.filter_by(status='已归还').count()
-
-    # 月度统计
-    current_month = datetime.now().month
-    current_year = datetime.now().year
-
-    month_borrows = BorrowRecord.query.filter(
-        db.extract('year', BorrowRecord.created_at) == current_year,
-        db.extract('month', BorrowRecord.created_at) == current_month
-    ).count()
+    return jsonify(current_stats().to_dict())
+
+
+# ========== 增量同步API路由 ==========
+
+CHANGE_FEED_PAGE_SIZE = 500
+CHANGE_FEED_MAX_PAGE_SIZE = 5000
+# 水位线往回留出的余量，覆盖时间戳已生成但尚未提交的写入
+CHANGE_FEED_SAFETY_LAG = timedelta(minutes=5)
+
+
+def _change_feed(model, table_name):
+    """按 (updated_at, id) 分页返回 since 之后变化过的数据
+
+    首页（不带 cursor）同时返回 since 之后的删除记录。
+    同步方沿 next_cursor 翻页直到为空，再把 watermark 作为下次的 since。
+    """
+    try:
+        since = _parse_since_arg()
+    except ValueError:
+        return _since_error()
+
+    limit = request.args.get('limit', CHANGE_FEED_PAGE_SIZE, type=int)
+    limit = min(max(limit, 1), CHANGE_FEED_MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor', '')
+    watermark = datetime.utcnow() - CHANGE_FEED_SAFETY_LAG
+
+    query = model.query
+    if since:
+        query = query.filter(model.updated_at >= since)
+    page = keyset_paginate(query, model.updated_at, model.id, cursor=cursor, per_page=limit)
+
+    deleted = []
+    if since and not cursor:
+        deleted = [
+            tombstone.to_dict() for tombstone in DeletedRecord.query
+            .filter(DeletedRecord.table_name == table_name, DeletedRecord.deleted_at >= since)
+            .order_by(DeletedRecord.deleted_at, DeletedRecord.id)
+        ]
 
     return jsonify({
-        'devices': {
-            'total': total_devices,
-            'normal': normal_devices,
-            'borrowed': borrowed_devices,
-            'maintenance': maintenance_devices
-        },
-        'borrows': {
-            'total': total_borrows,
-            'active': active_borrows,
-            'returned': returned_borrows,
-            'this_month': month_borrows
-        }
+        'items': [item.to_dict() for item in page.items],
+        'deleted': deleted,
+        'next_cursor': page.next_cursor,
+        'watermark': watermark.isoformat()
     })
 
 
+@bp.route('/api/changes/devices')
+@login_required
+def api_device_changes():
+    """设备增量同步"""
+    return _change_feed(Device, 'device')
+
+
+@bp.route('/api/changes/borrow_records')
+@login_required
+def api_borrow_record_changes():
+    """借用记录增量同步"""
+    return _change_feed(BorrowRecord, 'borrow_record')
+
+
 # ========== 修改密码和用户名路由 ==========
 
-@app.route('/change-password', methods=['GET', 'POST'])
+@bp.route('/change-password', methods=['GET', 'POST'])
 @login_required
 def change_password():
     """修改当前用户密码"""
@@ -691,17 +1714,17 @@ def change_password():
         # 验证旧密码
         if not check_password_hash(current_user.password, old_password):
             flash('旧密码错误！', 'danger')
-            return redirect(url_for('change_password'))
+            return redirect(url_for('main.change_password'))
 
         # 检查新密码和确认密码是否一致
         if new_password != confirm_password:
             flash('两次输入的新密码不一致！', 'danger')
-            return redirect(url_for('change_password'))
+            return redirect(url_for('main.change_password'))
 
         # 检查密码长度
         if len(new_password) < 6:
             flash('新密码至少需要6位！', 'danger')
-            return redirect(url_for('change_password'))
+            return redirect(url_for('main.change_password'))
 
         # 更新密码
         current_user.password = generate_password_hash(new_password)
@@ -709,12 +1732,12 @@ def change_password():
 
         flash('密码修改成功！请重新登录。', 'success')
         logout_user()
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     return render_template('change_password.html')
 
 
-@app.route('/change-username', methods=['GET', 'POST'])
+@bp.route('/change-username', methods=['GET', 'POST'])
 @login_required
 def change_username():
     """修改当前用户名"""
@@ -725,12 +1748,12 @@ def change_username():
         existing_user = User.query.filter_by(username=new_username).first()
         if existing_user and existing_user.id != current_user.id:
             flash('该用户名已存在！', 'danger')
-            return redirect(url_for('change_username'))
+            return redirect(url_for('main.change_username'))
 
         # 检查用户名长度
         if len(new_username) < 3:
             flash('用户名至少需要3位！', 'danger')
-            return redirect(url_for('change_username'))
+            return redirect(url_for('main.change_username'))
 
         # 更新用户名
         old_username = current_user.username
@@ -738,20 +1761,143 @@ def change_username():
         db.session.commit()
 
         flash(f'用户名已从 "{old_username}" 修改为 "{new_username}"！', 'success')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     return render_template('change_username.html')
 
 
+# ========== 数据维护 ==========
+
+def maintenance_settings():
+    """从配置中取出维护任务的间隔和参数"""
+    config = current_app.config
+    return {
+        'intervals': {name: config[f'MAINTENANCE_{name.upper()}_INTERVAL'] for name in maintenance.JOBS},
+        'quiet_seconds': config['MAINTENANCE_QUIET_SECONDS'],
+        'max_delay': config['MAINTENANCE_MAX_DELAY'],
+        'vacuum_pages': config['MAINTENANCE_VACUUM_PAGES'],
+        'vacuum_sleep': config['MAINTENANCE_VACUUM_SLEEP'],
+        'backup_dir': config['MAINTENANCE_BACKUP_DIR'] or os.path.join(current_app.instance_path, 'backup'),
+        'journal_dir': config['CHANGE_JOURNAL_DIR'] or os.path.join(current_app.instance_path, 'journal'),
+        'backup_keep_days': config['MAINTENANCE_BACKUP_KEEP_DAYS'],
+        'heartbeat_file': os.path.join(current_app.instance_path, maintenance.HEARTBEAT_FILE),
+    }
+
+
+def maintenance_status():
+    """各维护任务的上次运行情况 {任务名: dict 或 None}"""
+    status = {}
+    for name in maintenance.JOBS:
+        value = get_state(maintenance.STATE_PREFIX + name)
+        status[name] = json.loads(value) if value else None
+    return status
+
+
+def run_maintenance_job(name, settings):
+    """执行一项维护任务并把结果记入 system_state"""
+    started = time.monotonic()
+    try:
+        if name == 'utilization':
+            start, count = update_utilization()
+            result = f'已汇总到 {utilization_rolled_through()}（自 {start} 起重算 {count} 行）'
+        elif name == 'overdue':
+            count = sweep_overdue()
+            db.session.commit()
+            if count:
+                data_changed('borrow_record')
+            result = f'标记 {count} 条借用记录为超期未还'
+        else:
+            result = maintenance.run_job(name, db.engine.url.database, settings)
+        ok = True
+    except Exception as e:
+        db.session.rollback()
+        result, ok = str(e), False
+    set_state(maintenance.STATE_PREFIX + name, json.dumps({
+        'at': datetime.now().isoformat(timespec='seconds'),
+        'seconds': round(time.monotonic() - started, 2),
+        'ok': ok,
+        'result': result[:120],
+    }, ensure_ascii=False))
+    db.session.commit()
+    return ok, result
+
+
+@bp.cli.command('maintenance')
+@click.option('--once', is_flag=True, help='执行一遍到期的任务后退出（不等待空闲）')
+@click.option('--job', type=click.Choice(list(maintenance.JOBS)), multiple=True,
+              help='只执行指定的任务（可重复），忽略间隔')
+def maintenance_command(once, job):
+    """数据库维护常驻进程：定期备份、ANALYZE、增量 VACUUM、WAL 检查点、使用率日汇总和超期标记
+
+    只需运行一个（如由 systemd 或 Windows 计划任务启动），与 web 工作进程相互独立。
+    """
+    settings = maintenance_settings()
+    if job or once:
+        names = job or maintenance.due_jobs(settings['intervals'], _last_runs(), datetime.now())
+        for name in names:
+            ok, result = run_maintenance_job(name, settings)
+            print(f"{'✓' if ok else '✗'} {maintenance.JOBS[name]}: {result}")
+        return
+
+    maintenance.lower_priority()
+    monitor = maintenance.ActivityMonitor(db.engine.url.database)
+    print(f"✓ 维护进程已启动，空闲 {settings['quiet_seconds']} 秒后执行到期任务", flush=True)
+    started_at = datetime.now()
+    try:
+        while True:
+            maintenance.write_heartbeat(settings['heartbeat_file'])
+
+            now = datetime.now()
+            last_runs = _last_runs()
+            db.session.rollback()  # 结束读事务，空闲等待时不占住 WAL 快照
+            for name in maintenance.due_jobs(settings['intervals'], last_runs, now):
+                # 到期后等空闲再执行；推迟太久（数据库一直繁忙）则不再等待。
+                # 每项任务单独判断，一项在等空闲不妨碍后面已超期的任务
+                if (monitor.quiet_for() < settings['quiet_seconds'] and
+                        not maintenance.overdue(name, settings['intervals'], last_runs, now,
+                                                started_at, settings['max_delay'])):
+                    continue
+                ok, result = run_maintenance_job(name, settings)
+                monitor.ignore_changes()
+                print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {'✓' if ok else '✗'} "
+                      f"{maintenance.JOBS[name]}: {result}", flush=True)
+            time.sleep(current_app.config['MAINTENANCE_POLL_SECONDS'])
+    except KeyboardInterrupt:
+        print("维护进程已停止")
+    finally:
+        monitor.close()
+
+
+def _last_runs():
+    return {name: maintenance.parse_time(run['at']) if run else None
+            for name, run in maintenance_status().items()}
+
+
+@bp.route('/admin/maintenance')
+@login_required
+def maintenance_page():
+    """数据备份与维护状态（仅管理员）"""
+    if current_user.role != 'admin':
+        flash('权限不足！', 'danger')
+        return redirect(url_for('main.dashboard'))
+
+    settings = maintenance_settings()
+    heartbeat = maintenance.read_heartbeat(settings['heartbeat_file'])
+    daemon_alive = heartbeat is not None and (datetime.now() - heartbeat).total_seconds() < 120
+    return render_template('maintenance.html', jobs=maintenance.JOBS, status=maintenance_status(),
+                           intervals=settings['intervals'], heartbeat=heartbeat,
+                           daemon_alive=daemon_alive, settings=settings)
+
+
 # ========== 邀请码管理路由 ==========
 
-@app.route('/admin/invitation-codes')
+@bp.route('/admin/invitation-codes')
 @login_required
 def invitation_codes():
     """邀请码管理页面（仅管理员）"""
     if current_user.role != 'admin':
         flash('权限不足！', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     # 获取所有邀请码
     codes = InvitationCode.query.order_by(InvitationCode.created_at.desc()).all()
@@ -759,7 +1905,7 @@ def invitation_codes():
     return render_template('invitation_codes.html', codes=codes)
 
 
-@app.route('/admin/invitation-code/generate', methods=['POST'])
+@bp.route('/admin/invitation-code/generate', methods=['POST'])
 @login_required
 def generate_invitation_code():
     """生成邀请码（仅管理员）"""
@@ -812,13 +1958,13 @@ def generate_invitation_code():
         return jsonify({'success': False, 'message': f'生成失败：{str(e)}'})
 
 
-@app.route('/admin/invitation-code/toggle/<int:code_id>')
+@bp.route('/admin/invitation-code/toggle/<int:code_id>')
 @login_required
 def toggle_invitation_code(code_id):
     """启用/禁用邀请码（仅管理员）"""
     if current_user.role != 'admin':
         flash('权限不足！', 'danger')
-        return redirect(url_for('invitation_codes'))
+        return redirect(url_for('main.invitation_codes'))
 
     code = InvitationCode.query.get_or_404(code_id)
     code.is_active = not code.is_active
@@ -827,30 +1973,64 @@ def toggle_invitation_code(code_id):
 
     status = "启用" if code.is_active else "禁用"
     flash(f'邀请码 {code.code} 已{status}', 'success')
-    return redirect(url_for('invitation_codes'))
+    return redirect(url_for('main.invitation_codes'))
 
 
-@app.route('/admin/invitation-code/delete/<int:code_id>')
+@bp.route('/admin/invitation-code/delete/<int:code_id>')
 @login_required
 def delete_invitation_code(code_id):
     """删除邀请码（仅管理员）"""
     if current_user.role != 'admin':
         flash('权限不足！', 'danger')
-        return redirect(url_for('invitation_codes'))
+        return redirect(url_for('main.invitation_codes'))
 
     code = InvitationCode.query.get_or_404(code_id)
     code_value = code.code
 
+    # 已用此邀请码注册的用户解除关联，否则外键约束不允许删除
+    User.query.filter_by(invitation_code_id=code.id).update({'invitation_code_id': None})
     db.session.delete(code)
     db.session.commit()
 
     flash(f'邀请码 {code_value} 已删除', 'success')
-    return redirect(url_for('invitation_codes'))
+    return redirect(url_for('main.invitation_codes'))
+
+def create_app(config=Config):
+    """创建应用
+
+    只读取配置、注册扩展和路由，不访问数据库，工作进程可以快速导入和启动。
+    建表、升级和默认管理员由 flask init-db 完成。
+    """
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    db.init_app(app)
+    # 每个新连接设置 WAL、busy_timeout 等 PRAGMA（须在第一次连接数据库之前）
+    with app.app_context():
+        sqlite_tuning.install(db.engine, sqlite_tuning.pragmas_from_config(app.config))
+        if app.config['CHANGE_JOURNAL']:
+            change_journal.install(db.engine, app.config['CHANGE_JOURNAL_DIR']
+                                   or os.path.join(app.instance_path, 'journal'))
+
+    app.extensions['stats_cache'] = VersionedCache(ttl=app.config['STATS_CACHE_TTL'])
+    app.extensions['fragment_cache'] = FragmentCache(max_bytes=app.config['FRAGMENT_CACHE_MAX_BYTES'],
+                                                     ttl=app.config['STATS_CACHE_TTL'])
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    return app
+
+
+app = create_app()
 
 if __name__ == '__main__':
+    # 开发服务器（单进程，仅供本机调试）：启动前顺带初始化数据库
+    # 生产环境请使用 python serve.py
+    with app.app_context():
+        init_database()
     print("=" * 50)
-    print("设备管理系统启动中...")
+    print("设备管理系统启动中（开发服务器）...")
     print(f"访问地址: http://127.0.0.1:5000")
     print(f"默认管理员: admin / admin123")
+    print("生产部署请使用: python serve.py")
     print("=" * 50)
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1', host='127.0.0.1', port=5000)
\ No newline at end of file
@@ -5,12 +5,232 @@
 """
 
 import os
-import shutil
+import base64
+import contextlib
 import datetime
+import hashlib
+import json
+import sqlite3
 import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 在线备份每步复制的页数和每步之间的暂停（秒）：每步只短暂持有读锁，
+# 应用的写操作可以穿插在步与步之间进行
+PAGES_PER_STEP = 256
+STEP_SLEEP = 0.05
+
+# 备份期间源库被其他连接写入时，SQLite 会从头重新复制；
+# 重新开始超过这么多次就改为一步复制完（WAL 模式下读锁不阻塞写入）
+MAX_RESTARTS = 3
+
+
+def file_checksum(path):
+    """计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def checksum_file_for(backup_file):
+    return backup_file + '.sha256'
+
+
+def write_checksum(backup_file):
+    """计算并写出 sha256sum 格式的校验文件，返回校验和"""
+    checksum = file_checksum(backup_file)
+    with open(checksum_file_for(backup_file), 'w', encoding='utf-8') as f:
+        f.write(f"{checksum}  {os.path.basename(backup_file)}\n")
+    return checksum
+
+
+def verify_checksum(backup_file):
+    """核对备份文件与校验文件；没有校验文件（旧备份）时返回 None"""
+    checksum_path = checksum_file_for(backup_file)
+    if not os.path.exists(checksum_path):
+        return None
+    with open(checksum_path, encoding='utf-8') as f:
+        expected = f.read().split()[0]
+    return file_checksum(backup_file) == expected
+
+
+def integrity_check(db_file):
+    """对数据库执行 PRAGMA integrity_check，返回问题列表（空列表表示完好）"""
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    try:
+        rows = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    return [] if rows == ['ok'] else rows
+
+
+class _BackupRestarted(Exception):
+    """分步复制因源库不断被写入而反复重新开始"""
+
+
+# 备份目录索引：每个完整备份一条记录（文件名、时间、大小、校验和、各表行数、结构摘要），
+# 列表、恢复和清理都读索引，不再依赖文件的修改时间
+CATALOG_FILE = 'catalog.json'
+
+
+def catalog_path(backup_dir):
+    return os.path.join(backup_dir, CATALOG_FILE)
+
+
+def save_catalog(backup_dir, entries):
+    """写入索引（先写临时文件再改名）"""
+    path = catalog_path(backup_dir)
+    with open(path + '.part', 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False, indent=1)
+    os.replace(path + '.part', path)
+
+
+def schema_hash(conn):
+    """数据库结构（sqlite_master 中全部建表、索引、触发器语句）的 SHA-256
+
+    不用 PRAGMA schema_version：在线备份复制出的文件里它会重新计数，与源库无关，区分不了结构。
+    """
+    digest = hashlib.sha256()
+    for type_, name, sql in conn.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL ORDER BY type, name"):
+        digest.update(f"{type_}\0{name}\0{sql}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def describe_backup(db_file):
+    """读取备份文件的结构摘要和各表行数"""
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_file)}?mode=ro", uri=True)
+    try:
+        structure = schema_hash(conn)
+        # 只统计普通表；全文索引（虚拟表）和它的影子表由触发器维护，不必统计
+        virtual = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%'")]
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+            "ORDER BY name")
+            if row[0] not in virtual and not any(row[0].startswith(v + '_') for v in virtual)]
+        row_counts = {}
+        for table in tables:
+            row_counts[table] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+    finally:
+        conn.close()
+    return structure, row_counts
+
+
+def database_schema_hash(db_file):
+    """当前数据库的结构摘要，数据库不存在或无法读取时返回 None"""
+    if not os.path.exists(db_file):
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{os.path.abspath(db_file)}?mode=ro", uri=True)
+        try:
+            return schema_hash(conn)
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError:
+        return None
+
+
+def catalog_entry(backup_file, created_at, checksum):
+    structure, row_counts = describe_backup(backup_file)
+    return {
+        'filename': os.path.basename(backup_file),
+        'created_at': created_at.isoformat(timespec='seconds'),
+        'size': os.path.getsize(backup_file),
+        'sha256': checksum,
+        'schema_hash': structure,
+        'row_counts': row_counts,
+        'verified_at': None,
+        'status': 'ok',
+    }
+
+
+def load_catalog(backup_dir='backup'):
+    """读取索引，按备份时间倒序；没有索引时（旧版本留下的备份）扫描一次目录建立索引"""
+    if not os.path.exists(backup_dir):
+        return []
+    path = catalog_path(backup_dir)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            entries = json.load(f)
+    else:
+        entries = []
+        for filename in os.listdir(backup_dir):
+            if filename.startswith("devices_backup_") and filename.endswith(".db"):
+                filepath = os.path.join(backup_dir, filename)
+                created_at = datetime.datetime.fromtimestamp(os.path.getmtime(filepath))
+                try:
+                    entries.append(catalog_entry(filepath, created_at, file_checksum(filepath)))
+                except sqlite3.DatabaseError:
+                    entries.append({'filename': filename,
+                                    'created_at': created_at.isoformat(timespec='seconds'),
+                                    'size': os.path.getsize(filepath),
+                                    'sha256': file_checksum(filepath),
+                                    'schema_hash': None, 'row_counts': {},
+                                    'verified_at': None, 'status': 'corrupt'})
+        if entries:
+            save_catalog(backup_dir, entries)
+    entries.sort(key=lambda e: e['created_at'], reverse=True)
+    return entries
+
+
+def online_copy(source_file, target_file, pages=PAGES_PER_STEP, sleep=STEP_SLEEP):
+    """用 SQLite 在线备份 API 把 source_file 复制到 target_file，返回复制重新开始的次数
+
+    分步复制，每步之间暂停，源库在复制期间照常读写。重新开始太多次时改为一步复制完。
+    target_file 可以是正在使用的数据库（恢复时），写入经过 SQLite 的锁，WAL 文件也会一并处理。
+    """
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        # 剩余页数变多说明源库被写入、复制重新开始
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > MAX_RESTARTS:
+                raise _BackupRestarted()
+        last_remaining = remaining
+        # 每步结束时源库的锁已经释放，在这里暂停让应用的写操作进来
+        if remaining:
+            time.sleep(sleep)
+
+    source = sqlite3.connect(source_file)
+    target = sqlite3.connect(target_file)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=progress, sleep=sleep)
+        except _BackupRestarted:
+            source.backup(target, pages=-1)
+    finally:
+        target.close()
+        source.close()
+    return restarts
+
+
+def make_standalone(db_file):
+    """把复制出的数据库改回 DELETE 日志模式
+
+    在线备份会连同 WAL 模式一起复制过来，改回后备份是不依赖 -wal/-shm 文件的单个文件。
+    """
+    conn = sqlite3.connect(db_file)
+    try:
+        conn.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        conn.close()
+
 
 def backup_database():
-    """备份数据库文件"""
+    """备份数据库文件（在线备份，不影响正在运行的应用）"""
     
     # 数据库文件路径
     db_file = 'devices.db'
@@ -33,16 +253,44 @@ def backup_database():
     timestamp = now.strftime("%Y%m%d_%H%M%S")  # 格式: 20240107_143022
     backup_file = os.path.join(backup_dir, f"devices_backup_{timestamp}.db")
     
+    # 先写到临时文件，检查通过后再改名，备份目录里不会出现半成品
+    partial_file = backup_file + '.part'
+    
     try:
-        # 复制数据库文件
-        shutil.copy2(db_file, backup_file)
+        started = time.monotonic()
+        online_copy(db_file, partial_file)
+        make_standalone(partial_file)
+        
+        # 完整性检查
+        problems = integrity_check(partial_file)
+        if problems:
+            os.remove(partial_file)
+            print("备份失败：备份文件完整性检查未通过")
+            for problem in problems[:10]:
+                print(f"  {problem}")
+            return False
+        
+        os.replace(partial_file, backup_file)
+        checksum = write_checksum(backup_file)
         file_size = os.path.getsize(backup_file) / 1024  # 转换为KB
         
+        # 登记到备份索引（读-改-写与清理、检查等其他进程互斥）
+        entry = catalog_entry(backup_file, now, checksum)
+        with backup_lock(backup_dir):
+            entries = [e for e in load_catalog(backup_dir) if e['filename'] != entry['filename']]
+            save_catalog(backup_dir, [entry] + entries)
+        
         print("=" * 50)
         print("数据库备份成功！")
         print(f"源文件: {db_file}")
         print(f"备份到: {backup_file}")
         print(f"文件大小: {file_size:.2f} KB")
+        print(f"用时: {time.monotonic() - started:.2f} 秒")
+        print("完整性检查: 通过")
+        print(f"SHA-256: {checksum}")
+        print(f"结构摘要: {entry['schema_hash'][:12]}，"
+              f"设备 {entry['row_counts'].get('device', 0)} 条，"
+              f"借用记录 {entry['row_counts'].get('borrow_record', 0)} 条")
         print(f"备份时间: {now.strftime('%Y-%m-%d %H:%M:%S')}")
         print("=" * 50)
         
@@ -52,37 +300,42 @@ def backup_database():
         return True
         
     except Exception as e:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
         print(f"备份失败: {e}")
         return False
 
 def cleanup_old_backups(backup_dir, days_to_keep=7):
-    """清理超过指定天数的旧备份"""
+    """清理超过指定天数的旧备份（期间持有 backup_lock）"""
     
     try:
-        now = datetime.datetime.now()
-        cutoff_time = now - datetime.timedelta(days=days_to_keep)
+        with backup_lock(backup_dir):
+            now = datetime.datetime.now()
+            cutoff_time = now - datetime.timedelta(days=days_to_keep)
         
-        deleted_count = 0
-        total_saved = 0
+            deleted_count = 0
+            total_saved = 0
         
-        # 遍历备份目录中的所有文件
-        for filename in os.listdir(backup_dir):
-            if filename.startswith("devices_backup_") and filename.endswith(".db"):
-                filepath = os.path.join(backup_dir, filename)
-                
-                # 获取文件修改时间
-                file_mtime = datetime.datetime.fromtimestamp(os.path.getmtime(filepath))
-                
-                # 如果文件超过保留天数，删除
-                if file_mtime < cutoff_time:
-                    file_size = os.path.getsize(filepath) / 1024
+            # 按索引中记录的备份时间判断
+            entries = load_catalog(backup_dir)
+            kept = []
+            for entry in entries:
+                if datetime.datetime.fromisoformat(entry['created_at']) >= cutoff_time:
+                    kept.append(entry)
+                    continue
+                filepath = os.path.join(backup_dir, entry['filename'])
+                file_size = entry['size'] / 1024
+                if os.path.exists(filepath):
                     os.remove(filepath)
-                    deleted_count += 1
-                    total_saved += file_size
-                    print(f"删除旧备份: {filename} ({file_size:.2f} KB)")
+                if os.path.exists(checksum_file_for(filepath)):
+                    os.remove(checksum_file_for(filepath))
+                deleted_count += 1
+                total_saved += file_size
+                print(f"删除旧备份: {entry['filename']} ({file_size:.2f} KB)")
         
-        if deleted_count > 0:
-            print(f"清理完成: 删除了 {deleted_count} 个旧备份，节省 {total_saved:.2f} KB")
+            if deleted_count > 0:
+                save_catalog(backup_dir, kept)
+                print(f"清理完成: 删除了 {deleted_count} 个旧备份，节省 {total_saved:.2f} KB")
             
     except Exception as e:
         print(f"清理旧备份时出错: {e}")
@@ -96,20 +349,7 @@ def list_backups():
         print("备份目录不存在！")
         return
     
-    backups = []
-    
-    for filename in os.listdir(backup_dir):
-        if filename.startswith("devices_backup_") and filename.endswith(".db"):
-            filepath = os.path.join(backup_dir, filename)
-            file_size = os.path.getsize(filepath) / 1024
-            file_mtime = datetime.datetime.fromtimestamp(os.path.getmtime(filepath))
-            
-            backups.append({
-                'filename': filename,
-                'size_kb': file_size,
-                'modified': file_mtime,
-                'filepath': filepath
-            })
+    backups = load_catalog(backup_dir)
     
     if not backups:
         print("没有找到备份文件！")
@@ -118,13 +358,14 @@ def list_backups():
     print("=" * 80)
     print("数据库备份列表")
     print("=" * 80)
-    print(f"{'序号':<5} {'备份文件':<30} {'大小(KB)':<10} {'备份时间':<20}")
+    print(f"{'序号':<5} {'备份文件':<30} {'大小(KB)':<10} {'备份时间':<20} {'设备':<6} {'借用记录':<8} {'状态'}")
     print("-" * 80)
     
-    backups.sort(key=lambda x: x['modified'], reverse=True)  # 按时间倒序排列
-    
     for i, backup in enumerate(backups, 1):
-        print(f"{i:<5} {backup['filename']:<30} {backup['size_kb']:<10.2f} {backup['modified'].strftime('%Y-%m-%d %H:%M:%S'):<20}")
+        counts = backup['row_counts']
+        print(f"{i:<5} {backup['filename']:<30} {backup['size'] / 1024:<10.2f} "
+              f"{backup['created_at'].replace('T', ' '):<20} "
+              f"{counts.get('device', '-'):<6} {counts.get('borrow_record', '-'):<8} {backup['status']}")
     
     print("-" * 80)
     print(f"共 {len(backups)} 个备份文件")
@@ -140,24 +381,12 @@ def restore_backup(backup_number=None, backup_filename=None):
         return False
     
     # 获取备份文件列表
-    backups = []
-    for filename in os.listdir(backup_dir):
-        if filename.startswith("devices_backup_") and filename.endswith(".db"):
-            filepath = os.path.join(backup_dir, filename)
-            file_mtime = datetime.datetime.fromtimestamp(os.path.getmtime(filepath))
-            
-            backups.append({
-                'filename': filename,
-                'filepath': filepath,
-                'modified': file_mtime
-            })
+    backups = load_catalog(backup_dir)
     
     if not backups:
         print("没有找到备份文件！")
         return False
     
-    backups.sort(key=lambda x: x['modified'], reverse=True)
-    
     # 如果没有指定备份文件，显示列表让用户选择
     if backup_filename is None and backup_number is None:
         list_backups()
@@ -190,24 +419,126 @@ def restore_backup(backup_number=None, backup_filename=None):
             print("无效的序号！")
             return False
         backup_filename = backups[backup_number - 1]['filename']
-        backup_filepath = backups[backup_number - 1]['filepath']
+    
+    backup_filepath = os.path.join(backup_dir, backup_filename)
+    if not os.path.exists(backup_filepath):
+        print(f"备份文件 {backup_filename} 不存在！")
+        return False
+    
+    # 恢复前核对校验和与完整性
+    if verify_checksum(backup_filepath) is False:
+        print(f"备份文件 {backup_filename} 与校验和不符，已损坏，不能恢复！")
+        return False
+    problems = integrity_check(backup_filepath)
+    if problems:
+        print(f"备份文件 {backup_filename} 完整性检查未通过，不能恢复！")
+        return False
+    
+    entry = next((e for e in backups if e['filename'] == backup_filename), None)
+    current = database_schema_hash('devices.db')
+    if entry and entry.get('schema_hash') and current and entry['schema_hash'] != current:
+        print("注意：该备份的数据库结构与当前数据库不同（可能是升级前的备份），"
+              "恢复后请执行 flask init-db 升级数据库结构。")
+    
+    return restore_from_file(backup_filepath, backup_filename)
+
+def verify_one(args):
+    """在子进程中核对一个备份：校验和 + PRAGMA integrity_check，返回 (文件名, 问题列表)"""
+    filepath, expected_checksum = args
+    filename = os.path.basename(filepath)
+    if not os.path.exists(filepath):
+        return filename, ["文件不存在"]
+    if expected_checksum and file_checksum(filepath) != expected_checksum:
+        return filename, ["SHA-256 与索引记录不符"]
+    try:
+        return filename, integrity_check(filepath)
+    except sqlite3.DatabaseError as e:
+        return filename, [str(e)]
+
+
+def verify_snapshot(args):
+    """在子进程中核对一个增量快照：重建 + 校验和 + PRAGMA integrity_check，返回 (快照名, 问题列表)
+
+    调用方持有 backup_lock，检查期间块不会被清理。
+    """
+    manifest, backup_dir = args
+    target = os.path.join(backup_dir, f".{manifest['name']}.verify.db")
+    try:
+        problem = assemble_snapshot(manifest, target, backup_dir)
+        if problem:
+            return manifest['name'], [problem]
+        try:
+            return manifest['name'], integrity_check(target)
+        except sqlite3.DatabaseError as e:
+            return manifest['name'], [str(e)]
+    finally:
+        if os.path.exists(target):
+            os.remove(target)
+
+
+def verify_backups(backup_dir='backup', workers=None):
+    """多进程并行检查全部完整备份和增量快照，把完整备份的结果记入索引，返回损坏的个数"""
+    if not os.path.exists(backup_dir):
+        print("没有找到备份文件！")
+        return 0
+    
+    # 检查期间持有锁：清理不会删掉正在检查的文件和块，索引的读写也不会与备份交错
+    with backup_lock(backup_dir):
+        entries = load_catalog(backup_dir)
+        manifests = load_snapshots(backup_dir)
+        if not entries and not manifests:
+            print("没有找到备份文件！")
+            return 0
+        
+        started = time.monotonic()
+        jobs = [(os.path.join(backup_dir, e['filename']), e['sha256']) for e in entries]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = dict(pool.map(verify_one, jobs))
+            snapshot_results = list(pool.map(verify_snapshot, [(m, backup_dir) for m in manifests]))
+        
+        checked_at = datetime.datetime.now().isoformat(timespec='seconds')
+        corrupt = 0
+        for entry in entries:
+            problems = results[entry['filename']]
+            entry['verified_at'] = checked_at
+            entry['status'] = 'corrupt' if problems else 'ok'
+            if problems:
+                corrupt += 1
+                print(f"损坏: {entry['filename']}")
+                for problem in problems[:10]:
+                    print(f"  {problem}")
+        if entries:
+            save_catalog(backup_dir, entries)
+        for name, problems in snapshot_results:
+            if problems:
+                corrupt += 1
+                print(f"损坏: 快照 {name}")
+                for problem in problems[:10]:
+                    print(f"  {problem}")
+    
+    print(f"检查 {len(entries)} 个完整备份、{len(manifests)} 个增量快照，损坏 {corrupt} 个，"
+          f"用时 {time.monotonic() - started:.2f} 秒")
+    return corrupt
+
+def restore_from_file(backup_filepath, label):
+    """用已经核对过的数据库文件替换当前数据库（先把当前数据库另存一份）"""
     
     # 备份当前数据库（如果存在）
     current_db = 'devices.db'
     if os.path.exists(current_db):
         now = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         temp_backup = f"devices_temp_backup_{now}.db"
-        shutil.copy2(current_db, temp_backup)
+        online_copy(current_db, temp_backup)
+        make_standalone(temp_backup)
         print(f"已备份当前数据库到: {temp_backup}")
     
     try:
-        # 恢复备份
-        backup_filepath = os.path.join(backup_dir, backup_filename)
-        shutil.copy2(backup_filepath, current_db)
+        # 恢复备份：经由 SQLite 写入当前数据库，不直接覆盖文件（WAL 文件会与之不一致）
+        online_copy(backup_filepath, current_db)
         
         print("=" * 50)
         print("数据库恢复成功！")
-        print(f"从备份恢复: {backup_filename}")
+        print(f"从备份恢复: {label}")
         print(f"恢复到: {current_db}")
         print(f"恢复时间: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print("=" * 50)
@@ -218,6 +549,497 @@ def restore_backup(backup_number=None, backup_filename=None):
         print(f"恢复失败: {e}")
         return False
 
+# ========== 增量备份 ==========
+#
+# 把数据库快照按固定大小（页对齐）切块，每块以内容的 SHA-256 命名、压缩后存入 chunks/，
+# 已经存在的块直接跳过；每个快照一份清单（snapshots/*.json）记录块的顺序和整个文件的校验和。
+# SQLite 就地改写页面，两次快照之间只有改动过的块需要写入。
+
+SNAPSHOT_DIR = 'snapshots'
+CHUNK_DIR = 'chunks'
+CHUNK_PAGES = 16  # 每块的页数（页大小 4KB 时每块 64KB）
+COMPRESS_LEVEL = 6
+MANIFEST_VERSION = 1
+LOCK_FILE = '.backup.lock'
+
+
+@contextlib.contextmanager
+def backup_lock(backup_dir):
+    """增量备份、清理和重建之间的跨进程互斥锁（维护进程和手动执行可能同时运行）"""
+    os.makedirs(backup_dir, exist_ok=True)
+    with open(os.path.join(backup_dir, LOCK_FILE), 'a+b') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK 重试约 10 秒后放弃，继续等待
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def chunk_path(backup_dir, digest):
+    return os.path.join(backup_dir, CHUNK_DIR, digest[:2], digest)
+
+
+def store_chunks(db_copy, backup_dir, chunk_size):
+    """把文件切块写入块仓库，返回 (块哈希列表, 新写入块数, 新写入字节数)"""
+    digests = []
+    new_chunks = new_bytes = 0
+    with open(db_copy, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest = hashlib.sha256(block).hexdigest()
+            digests.append(digest)
+            path = chunk_path(backup_dir, digest)
+            if os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = zlib.compress(block, COMPRESS_LEVEL)
+            with open(path + '.part', 'wb') as out:
+                out.write(data)
+            os.replace(path + '.part', path)
+            new_chunks += 1
+            new_bytes += len(data)
+    return digests, new_chunks, new_bytes
+
+
+def incremental_backup(db_file='devices.db', backup_dir='backup'):
+    """增量备份：只写入上次以来改动过的块"""
+    # 与清理互斥：清理不会删掉本次备份已经跳过（复用）但清单还没写出的块
+    with backup_lock(backup_dir):
+        if not os.path.exists(db_file):
+            print(f"错误：数据库文件 {db_file} 不存在！")
+            return False
+    
+        os.makedirs(os.path.join(backup_dir, SNAPSHOT_DIR), exist_ok=True)
+        now = datetime.datetime.now()
+        # 带微秒，同一秒内的两次备份不会互相覆盖清单
+        name = f"devices_{now.strftime('%Y%m%d_%H%M%S_%f')}"
+        snapshot_copy = os.path.join(backup_dir, f".{name}.db.part")
+    
+        try:
+            started = time.monotonic()
+            # 先在线复制出一致的快照，再对快照切块
+            online_copy(db_file, snapshot_copy)
+            make_standalone(snapshot_copy)
+            problems = integrity_check(snapshot_copy)
+            if problems:
+                print("备份失败：快照完整性检查未通过")
+                return False
+        
+            conn = sqlite3.connect(snapshot_copy)
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            conn.close()
+            chunk_size = page_size * CHUNK_PAGES
+        
+            digests, new_chunks, new_bytes = store_chunks(snapshot_copy, backup_dir, chunk_size)
+            manifest = {
+                'version': MANIFEST_VERSION,
+                'name': name,
+                'created_at': now.isoformat(timespec='microseconds'),
+                'source': os.path.abspath(db_file),
+                'size': os.path.getsize(snapshot_copy),
+                'sha256': file_checksum(snapshot_copy),
+                'page_size': page_size,
+                'chunk_size': chunk_size,
+                'chunks': digests,
+            }
+            manifest_path = os.path.join(backup_dir, SNAPSHOT_DIR, name + '.json')
+            with open(manifest_path + '.part', 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+            os.replace(manifest_path + '.part', manifest_path)
+        except Exception as e:
+            print(f"备份失败: {e}")
+            return False
+        finally:
+            if os.path.exists(snapshot_copy):
+                os.remove(snapshot_copy)
+    
+        print("=" * 50)
+        print("增量备份成功！")
+        print(f"快照: {name}")
+        print(f"数据库大小: {manifest['size'] / 1024:.2f} KB，共 {len(digests)} 块")
+        print(f"新写入: {new_chunks} 块，{new_bytes / 1024:.2f} KB（压缩后）")
+        print(f"用时: {time.monotonic() - started:.2f} 秒")
+        print(f"SHA-256: {manifest['sha256']}")
+        print("=" * 50)
+        return True
+
+
+def load_snapshots(backup_dir='backup'):
+    """读取全部快照清单，按创建时间倒序"""
+    directory = os.path.join(backup_dir, SNAPSHOT_DIR)
+    if not os.path.exists(directory):
+        return []
+    manifests = []
+    for filename in os.listdir(directory):
+        if filename.endswith('.json'):
+            with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                manifests.append(json.load(f))
+    manifests.sort(key=lambda m: m['created_at'], reverse=True)
+    return manifests
+
+
+def list_snapshots(backup_dir='backup'):
+    """列出全部增量备份快照"""
+    manifests = load_snapshots(backup_dir)
+    if not manifests:
+        print("没有找到增量备份！")
+        return
+    
+    print("=" * 80)
+    print(f"{'快照':<32} {'大小(KB)':<12} {'块数':<8} {'创建时间':<20}")
+    print("-" * 80)
+    for manifest in manifests:
+        print(f"{manifest['name']:<32} {manifest['size'] / 1024:<12.2f} "
+              f"{len(manifest['chunks']):<8} {manifest['created_at'].replace('T', ' ')[:19]:<20}")
+    print("-" * 80)
+    print(f"共 {len(manifests)} 个快照")
+    print("=" * 80)
+
+
+def assemble_snapshot(manifest, output_file, backup_dir='backup'):
+    """按清单把块拼回数据库文件，返回问题说明，None 表示校验和与备份时一致（调用方持有 backup_lock）"""
+    digest = hashlib.sha256()
+    with open(output_file, 'wb') as out:
+        for chunk_digest in manifest['chunks']:
+            path = chunk_path(backup_dir, chunk_digest)
+            if not os.path.exists(path):
+                return f"数据块 {chunk_digest} 不存在"
+            with open(path, 'rb') as f:
+                block = zlib.decompress(f.read())
+            if hashlib.sha256(block).hexdigest() != chunk_digest:
+                return f"数据块 {chunk_digest} 已损坏"
+            digest.update(block)
+            out.write(block)
+    if digest.hexdigest() != manifest['sha256']:
+        return "重建后 SHA-256 与清单不符"
+    return None
+
+
+def rebuild_snapshot(manifest, output_file, backup_dir='backup'):
+    """按清单把块拼回数据库文件，校验和与备份时一致才返回 True"""
+    # 与清理互斥：重建期间块不会被删除
+    with backup_lock(backup_dir):
+        problem = assemble_snapshot(manifest, output_file, backup_dir)
+    if problem:
+        print(f"{problem}！")
+    return problem is None
+
+
+def restore_snapshot(name=None, backup_dir='backup', output_file=None):
+    """从增量备份恢复；指定 output_file 时只重建到该文件，不替换当前数据库"""
+    manifests = load_snapshots(backup_dir)
+    if not manifests:
+        print("没有找到增量备份！")
+        return False
+    if name is None:
+        manifest = manifests[0]
+    else:
+        matches = [m for m in manifests if m['name'] == name]
+        if not matches:
+            print(f"快照 {name} 不存在！")
+            return False
+        manifest = matches[0]
+    
+    target = output_file or os.path.join(backup_dir, f".{manifest['name']}.restore.db")
+    try:
+        if not rebuild_snapshot(manifest, target, backup_dir):
+            print(f"快照 {manifest['name']} 重建后校验和不符，不能恢复！")
+            return False
+        if integrity_check(target):
+            print(f"快照 {manifest['name']} 完整性检查未通过，不能恢复！")
+            return False
+        if output_file:
+            print(f"快照 {manifest['name']} 已重建到 {output_file}（SHA-256 一致）")
+            return True
+        return restore_from_file(target, manifest['name'])
+    finally:
+        if not output_file and os.path.exists(target):
+            os.remove(target)
+
+
+def prune_snapshots(backup_dir='backup', days_to_keep=30):
+    """删除超过保留天数的快照清单，再删除不再被任何快照引用的块"""
+    # 与增量备份互斥，见 incremental_backup
+    with backup_lock(backup_dir):
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=days_to_keep)
+        kept = set()
+        removed = 0
+        for manifest in load_snapshots(backup_dir):
+            if datetime.datetime.fromisoformat(manifest['created_at']) < cutoff:
+                os.remove(os.path.join(backup_dir, SNAPSHOT_DIR, manifest['name'] + '.json'))
+                removed += 1
+            else:
+                kept.update(manifest['chunks'])
+    
+        freed = 0
+        chunk_root = os.path.join(backup_dir, CHUNK_DIR)
+        if os.path.exists(chunk_root):
+            for prefix in os.listdir(chunk_root):
+                for digest in os.listdir(os.path.join(chunk_root, prefix)):
+                    # .part 是正在写入（或中断留下）的块，不动它
+                    if digest not in kept and not digest.endswith('.part'):
+                        path = os.path.join(chunk_root, prefix, digest)
+                        freed += os.path.getsize(path)
+                        os.remove(path)
+                if not os.listdir(os.path.join(chunk_root, prefix)):
+                    os.rmdir(os.path.join(chunk_root, prefix))
+        print(f"清理完成: 删除 {removed} 个过期快照，释放 {freed / 1024:.2f} KB")
+
+# ========== 按时间点恢复 ==========
+#
+# 应用在每个事务提交后把它的写语句追加到 journal/changes-YYYYMMDD.jsonl（见 change_journal.py），
+# 并在同一事务里把事务号写进 system_state 的 journal_position、把原来的值记为日志行的 prev。
+# 恢复时取目标时间之前最近的一个完整备份或增量快照，从它记录的事务号开始沿 prev 链
+# 按提交顺序重放日志，直到目标时间。
+
+JOURNAL_DIR = 'journal'
+JOURNAL_POSITION_KEY = 'journal_position'
+REPLAY_BATCH = 5000  # 每多少个事务提交一次
+
+
+def journal_files(journal_dir=JOURNAL_DIR):
+    if not os.path.exists(journal_dir):
+        return []
+    return sorted(os.path.join(journal_dir, f) for f in os.listdir(journal_dir)
+                  if f.startswith('changes-') and f.endswith('.jsonl'))
+
+
+def read_journal(journal_dir=JOURNAL_DIR):
+    """按写入顺序逐个读出日志中的事务（多进程时和提交顺序可能略有出入）"""
+    for path in journal_files(journal_dir):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.endswith('\n'):  # 最后一行可能还没写完
+                    yield json.loads(line)
+
+
+def decode_value(value):
+    if isinstance(value, dict) and '$b' in value:
+        return base64.b64decode(value['$b'])
+    return value
+
+
+def decode_row(row):
+    if not isinstance(row, list) or any(isinstance(v, list) for v in row):
+        raise ValueError(f"参数格式不正确: {row!r}"[:200])
+    return tuple(decode_value(v) for v in row)
+
+
+def decode_params(params, many):
+    """日志中的参数：executemany 是多行，否则是一行；形状不对时抛出 ValueError"""
+    if many:
+        if not isinstance(params, list):
+            raise ValueError(f"参数格式不正确: {params!r}"[:200])
+        return [decode_row(row) for row in params]
+    return decode_row(params)
+
+
+def journal_order(journal_dir, since_tx):
+    """沿 prev 链排出 since_tx 之后提交的事务号
+
+    since_tx 为 None 时从第一个事务（prev 为空）开始。同一个 prev 有多个后继时
+    （恢复之后旧日志还在），取日志中靠后的，即恢复之后的新历史。
+    返回按提交顺序排列的事务号列表，since_tx 不在日志中时返回 None。
+    """
+    following = {}
+    found = since_tx is None
+    for entry in read_journal(journal_dir):
+        following[entry.get('prev')] = entry['tx']
+        found = found or since_tx in (entry['tx'], entry.get('prev'))
+    if not found:
+        return None
+    order, seen = [], set()
+    tx = following.get(since_tx)
+    while tx is not None and tx not in seen:
+        order.append(tx)
+        seen.add(tx)
+        tx = following.get(tx)
+    return order
+
+
+def journal_position(db_file):
+    """数据库文件中记录的最后一个已包含的事务号"""
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_file)}?mode=ro", uri=True)
+    try:
+        row = conn.execute("SELECT value FROM system_state WHERE key = ?",
+                           (JOURNAL_POSITION_KEY,)).fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def replay_journal(db_file, until, since_tx=None, since_time=None, journal_dir=JOURNAL_DIR):
+    """在数据库文件上重放 since_tx（或 since_time）之后、until 之前提交的事务
+
+    按 prev 链的提交顺序重放，连续的相同语句合并成一次 executemany，
+    每 REPLAY_BATCH 个事务提交一次。返回 (重放的事务数, 最后一个事务)。
+    """
+    order = journal_order(journal_dir, since_tx)
+    if order is None:
+        raise ValueError(f"日志中找不到事务 {since_tx}，日志不完整，无法从该备份重放")
+    
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA foreign_keys=OFF")
+    
+    pending_sql, pending_rows = None, []
+    
+    def flush():
+        nonlocal pending_sql, pending_rows
+        if pending_rows:
+            conn.executemany(pending_sql, pending_rows)
+        pending_sql, pending_rows = None, []
+    
+    def apply(entry):
+        nonlocal pending_sql
+        for sql, params, many in entry['statements']:
+            try:
+                params = decode_params(params, many)
+            except ValueError as e:
+                raise ValueError(f"日志中事务 {entry['tx']} 的{e}") from None
+            if 'RETURNING' in sql.upper():
+                flush()
+                for row in (params if many else [params]):
+                    conn.execute(sql, row).fetchall()
+                continue
+            if sql != pending_sql:
+                flush()
+                pending_sql = sql
+            if many:
+                pending_rows.extend(params)
+            else:
+                pending_rows.append(params)
+    
+    # 写入顺序和提交顺序不一致的事务先放在 waiting 里，轮到它时再重放
+    wanted = set(order)
+    waiting = {}
+    position = 0
+    applied = 0
+    last = None
+    conn.execute("BEGIN")
+    try:
+        for entry in read_journal(journal_dir):
+            if entry['tx'] not in wanted:
+                continue
+            waiting[entry['tx']] = entry
+            while position < len(order) and order[position] in waiting:
+                entry = waiting.pop(order[position])
+                position += 1
+                if since_time is not None and entry['ts'] <= since_time:
+                    continue
+                if entry['ts'] > until:
+                    position = len(order)
+                    break
+                apply(entry)
+                applied += 1
+                last = entry
+                if applied % REPLAY_BATCH == 0:
+                    flush()
+                    conn.execute("COMMIT")
+                    conn.execute("BEGIN")
+            if position == len(order):
+                break
+        flush()
+        if last is not None:
+            conn.execute("UPDATE system_state SET value = ?, updated_at = ? WHERE key = ?",
+                         (last['tx'], last['ts'].replace('T', ' '), JOURNAL_POSITION_KEY))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return applied, last
+
+
+def restore_point_in_time(until, backup_dir='backup', journal_dir=JOURNAL_DIR, output_file=None):
+    """恢复到 until（如 2024-01-07 14:30:00）时刻的状态"""
+    try:
+        until = datetime.datetime.fromisoformat(until).isoformat()
+    except ValueError:
+        print(f"无效的时间: {until}，格式如 2024-01-07 14:30:00")
+        return False
+    
+    # 目标时间之前最近的完整备份或增量快照
+    candidates = [(e['created_at'], 'backup', e) for e in load_catalog(backup_dir) if e['status'] == 'ok']
+    candidates += [(m['created_at'], 'snapshot', m) for m in load_snapshots(backup_dir)]
+    candidates = [c for c in candidates if c[0] <= until]
+    if not candidates:
+        print(f"{until.replace('T', ' ')} 之前没有可用的备份！")
+        return False
+    created_at, kind, base = max(candidates, key=lambda c: c[0])
+    label = base['filename'] if kind == 'backup' else base['name']
+    
+    target = output_file or os.path.join(backup_dir, ".pitr.restore.db")
+    try:
+        started = time.monotonic()
+        if kind == 'backup':
+            source = os.path.join(backup_dir, base['filename'])
+            if verify_checksum(source) is False or integrity_check(source):
+                print(f"备份文件 {label} 已损坏，不能作为恢复起点！")
+                return False
+            online_copy(source, target, pages=-1, sleep=0)
+            make_standalone(target)
+        elif not rebuild_snapshot(base, target, backup_dir):
+            print(f"快照 {label} 重建后校验和不符，不能作为恢复起点！")
+            return False
+        
+        position = journal_position(target)
+        if position is None:
+            print("警告：该备份没有记录日志位置，按备份时间开始重放")
+        applied, last = replay_journal(target, until, since_tx=position,
+                                       since_time=None if position else created_at,
+                                       journal_dir=journal_dir)
+        problems = integrity_check(target)
+        if problems:
+            print("重放后完整性检查未通过，不能恢复！")
+            return False
+        
+        print(f"起点: {label}（{created_at.replace('T', ' ')[:19]}）")
+        print(f"重放 {applied} 个事务，最后一个提交于 "
+              f"{last['ts'].replace('T', ' ')[:19] if last else created_at.replace('T', ' ')[:19]}，"
+              f"用时 {time.monotonic() - started:.2f} 秒")
+        if output_file:
+            print(f"已恢复到 {output_file}")
+            return True
+        return restore_from_file(target, f"{label} + 日志至 {until.replace('T', ' ')}")
+    except (ValueError, sqlite3.DatabaseError) as e:
+        print(f"恢复失败: {e}")
+        return False
+    except (KeyError, TypeError) as e:
+        print(f"恢复失败: 日志格式不正确（{e!r}）")
+        return False
+    finally:
+        if not output_file and os.path.exists(target):
+            os.remove(target)
+
+
+def prune_journal(backup_dir='backup', journal_dir=JOURNAL_DIR):
+    """删除比最早的备份还早的日志文件（这些日志已经不可能被重放）"""
+    bases = [e['created_at'] for e in load_catalog(backup_dir)]
+    bases += [m['created_at'] for m in load_snapshots(backup_dir)]
+    if not bases:
+        return
+    oldest = min(bases)[:10].replace('-', '')
+    for path in journal_files(journal_dir):
+        if os.path.basename(path)[len('changes-'):-len('.jsonl')] < oldest:
+            os.remove(path)
+            print(f"删除旧日志: {os.path.basename(path)}")
+
 def show_help():
     """显示帮助信息"""
     print("=" * 60)
@@ -227,12 +1049,21 @@ def show_help():
     print("  python backup_database.py backup    - 备份当前数据库")
     print("  python backup_database.py list      - 列出所有备份")
     print("  python backup_database.py restore   - 恢复数据库")
+    print("  python backup_database.py verify    - 并行检查全部备份和增量快照的完整性")
+    print("  python backup_database.py incremental         - 增量备份（只写入改动过的块）")
+    print("  python backup_database.py snapshots           - 列出增量备份快照")
+    print("  python backup_database.py restore-snapshot [快照名] [输出文件]")
+    print("                                                - 从增量备份恢复（默认最新快照）")
+    print("  python backup_database.py prune-snapshots [天数] - 清理过期快照和无用的块")
+    print("  python backup_database.py restore-pitr <时间> [输出文件]")
+    print("                                                - 恢复到指定时刻（备份 + 重放变更日志）")
     print("  python backup_database.py help      - 显示此帮助")
     print("=" * 60)
     print("示例:")
     print("  python backup_database.py backup")
     print("  python backup_database.py list")
     print("  python backup_database.py restore")
+    print('  python backup_database.py restore-pitr "2024-01-07 14:30:00"')
     print("=" * 60)
 
 def main():
@@ -246,10 +1077,30 @@ def main():
     
     if command == 'backup':
         backup_database()
+        prune_journal()
     elif command == 'list':
         list_backups()
     elif command == 'restore':
         restore_backup()
+    elif command == 'verify':
+        if verify_backups():
+            sys.exit(1)
+    elif command == 'incremental':
+        incremental_backup()
+        prune_snapshots()
+        prune_journal()
+    elif command == 'snapshots':
+        list_snapshots()
+    elif command == 'restore-snapshot':
+        restore_snapshot(name=sys.argv[2] if len(sys.argv) > 2 else None,
+                         output_file=sys.argv[3] if len(sys.argv) > 3 else None)
+    elif command == 'prune-snapshots':
+        prune_snapshots(days_to_keep=int(sys.argv[2]) if len(sys.argv) > 2 else 30)
+    elif command == 'restore-pitr':
+        if len(sys.argv) < 3:
+            print("请指定要恢复到的时间，如 \"2024-01-07 14:30:00\"")
+            return
+        restore_point_in_time(sys.argv[2], output_file=sys.argv[3] if len(sys.argv) > 3 else None)
     elif command == 'help':
         show_help()
     else:
@@ -0,0 +1,159 @@
+"""
+生产服务器并发压测：1、4、8 个 gunicorn 工作进程下主要页面的每秒请求数
+
+在临时目录建库（flask init-db）并导入一批设备和借用记录，分别以不同的
+工作进程数启动 serve.py，登录后由多个客户端进程以 keep-alive 连接轮流请求
+仪表板、设备列表、借用记录和统计接口，输出每种配置的每秒请求数和错误数。
+
+用法（需要 gunicorn，仅 Linux）：
+    python benchmarks/load.py [--seconds 10] [--clients 16] [--workers 1 4 8] [--threads 4]
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGES = ['/dashboard', '/devices', '/devices?' + urlencode({'status': '正常'}), '/borrow/records', '/api/stats']
+
+DEVICES = 2000
+BORROW_RECORDS = 10000
+
+
+def seed_database(tmp, env):
+    """建表并写入测试数据"""
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'],
+                   cwd=BASE_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    csv_path = os.path.join(tmp, 'devices.csv')
+    with open(csv_path, 'w', encoding='utf-8') as f:
+        f.write('设备名称,设备编号,设备型号,校准日期,所在地\n')
+        for i in range(DEVICES):
+            f.write(f'示波器{i},N{i:05d},M{i % 20},2024-01-01,实验室{i % 10}\n')
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'import-devices', csv_path],
+                   cwd=BASE_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+    today = date.today()
+    rows = []
+    for i in range(BORROW_RECORDS):
+        borrow_date = today - timedelta(days=random.randint(0, 700))
+        rows.append((random.randint(1, DEVICES), f'借用人{i % 50}', borrow_date,
+                     borrow_date + timedelta(days=7), borrow_date + timedelta(days=5), '已归还'))
+    conn.executemany(
+        "INSERT INTO borrow_record (device_id, borrower_name, borrow_date, expected_return_date, "
+        "actual_return_date, status, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, datetime('now'), datetime('now'))", rows)
+    conn.commit()
+    conn.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('服务器未能启动')
+
+
+def login(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('POST', '/login', body=urlencode({'username': 'admin', 'password': 'admin123'}),
+                 headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie', '').split(';')[0]
+    conn.close()
+    if not cookie:
+        raise RuntimeError('登录失败')
+    return cookie
+
+
+def client(args):
+    """一个客户端进程：在截止时间前循环请求各页面，返回 (成功数, 失败数)"""
+    port, cookie, deadline = args
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    done = failed = 0
+    i = random.randrange(len(PAGES))
+    while time.time() < deadline:
+        path = PAGES[i % len(PAGES)]
+        i += 1
+        try:
+            conn.request('GET', path, headers={'Cookie': cookie})
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                done += 1
+            else:
+                failed += 1
+        except (OSError, http.client.HTTPException):
+            failed += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.close()
+    return done, failed
+
+
+def run(env, workers, threads, clients, seconds):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, 'serve.py', '--server', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers), '--threads', str(threads)],
+        cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        cookie = login(port)
+        # 预热：每个工作进程建立连接、填充缓存
+        client((port, cookie, time.time() + 1))
+
+        deadline = time.time() + seconds
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.map(client, [(port, cookie, deadline)] * clients)
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    done = sum(r[0] for r in results)
+    failed = sum(r[1] for r in results)
+    return done / seconds, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生产服务器并发压测')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        seed_database(tmp, env)
+        print(f'CPU 核数 {os.cpu_count()}，客户端进程 {args.clients}，每进程线程 {args.threads}，'
+              f'页面 {", ".join(PAGES)}')
+        for workers in args.workers:
+            rps, failed = run(env, workers, args.threads, args.clients, args.seconds)
+            print(f'{workers:2d} 个工作进程: {rps:8.1f} 请求/秒  失败 {failed}')
+
+
+if __name__ == '__main__':
+    main()
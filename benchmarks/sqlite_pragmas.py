@@ -0,0 +1,153 @@
+"""
+SQLite PRAGMA 配置的并发吞吐对比
+
+在临时数据库上模拟借还高峰：若干写线程反复借出/归还设备（带状态条件的
+UPDATE + INSERT/UPDATE 借用记录，与 app.py 的写法相同），若干读线程反复执行
+设备列表和统计查询。分别用 SQLAlchemy 默认连接参数和 config.Config 中的
+SQLITE_* 配置各跑一遍，输出每秒完成的读/写事务数和 "database is locked" 次数。
+
+用法：
+    python benchmarks/sqlite_pragmas.py [--seconds 10] [--writers 4] [--readers 8]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite_tuning  # noqa: E402
+from config import Config  # noqa: E402
+
+DEVICES = 2000
+
+SCHEMA = [
+    """CREATE TABLE device (
+        id INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, number VARCHAR(100) UNIQUE NOT NULL,
+        location VARCHAR(200), status VARCHAR(20))""",
+    "CREATE INDEX ix_device_location_status ON device (location, status)",
+    """CREATE TABLE borrow_record (
+        id INTEGER PRIMARY KEY, device_id INTEGER NOT NULL REFERENCES device(id),
+        borrower_name VARCHAR(100) NOT NULL, borrow_date DATE NOT NULL,
+        actual_return_date DATE, status VARCHAR(20))""",
+    "CREATE INDEX ix_borrow_record_device_id ON borrow_record (device_id)",
+    "CREATE INDEX ix_borrow_record_status ON borrow_record (status)",
+]
+
+
+def create_database(path):
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as conn:
+        for ddl in SCHEMA:
+            conn.execute(text(ddl))
+        conn.execute(
+            text("INSERT INTO device (id, name, number, location, status) "
+                 "VALUES (:id, :name, :number, :location, '正常')"),
+            [{'id': i, 'name': f'设备{i}', 'number': f'N{i:05d}', 'location': f'实验室{i % 10}'}
+             for i in range(1, DEVICES + 1)]
+        )
+    engine.dispose()
+
+
+def borrow_or_return(conn, device_id):
+    """借出空闲设备，已借出的则归还（一个事务）"""
+    with conn.begin():
+        borrowed = conn.execute(
+            text("UPDATE device SET status = '借用中' WHERE id = :id AND status = '正常'"),
+            {'id': device_id}
+        ).rowcount
+        if borrowed:
+            conn.execute(
+                text("INSERT INTO borrow_record (device_id, borrower_name, borrow_date, status) "
+                     "VALUES (:id, 'bench', date('now'), '借用中')"),
+                {'id': device_id}
+            )
+        else:
+            conn.execute(
+                text("UPDATE borrow_record SET status = '已归还', actual_return_date = date('now') "
+                     "WHERE device_id = :id AND status = '借用中'"),
+                {'id': device_id}
+            )
+            conn.execute(text("UPDATE device SET status = '正常' WHERE id = :id"), {'id': device_id})
+
+
+def read_pages(conn):
+    """设备列表一页 + 状态统计"""
+    with conn.begin():
+        conn.execute(
+            text("SELECT * FROM device WHERE location = :location ORDER BY id LIMIT 21"),
+            {'location': f'实验室{random.randrange(10)}'}
+        ).all()
+        conn.execute(text("SELECT status, COUNT(id) FROM device GROUP BY status")).all()
+        conn.execute(text("SELECT status, COUNT(id) FROM borrow_record GROUP BY status")).all()
+
+
+def run(path, pragmas, seconds, writers, readers):
+    engine = create_engine(f'sqlite:///{path}', pool_size=writers + readers)
+    sqlite_tuning.install(engine, pragmas)
+
+    counts = {'write': 0, 'read': 0, 'locked': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def worker(kind):
+        done = locked = 0
+        with engine.connect() as conn:
+            while time.monotonic() < deadline:
+                try:
+                    if kind == 'write':
+                        borrow_or_return(conn, random.randint(1, DEVICES))
+                    else:
+                        read_pages(conn)
+                    done += 1
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    locked += 1
+        with lock:
+            counts[kind] += done
+            counts['locked'] += locked
+
+    threads = ([threading.Thread(target=worker, args=('write',)) for _ in range(writers)]
+               + [threading.Thread(target=worker, args=('read',)) for _ in range(readers)])
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    with engine.connect() as conn:
+        settings = sqlite_tuning.current_pragmas(conn, ['journal_mode', 'synchronous', 'busy_timeout'])
+    engine.dispose()
+    return counts, settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    args = parser.parse_args()
+
+    profiles = [
+        ('默认', []),
+        ('Config', sqlite_tuning.pragmas_from_config(vars(Config))),
+    ]
+    for label, pragmas in profiles:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.db')
+            create_database(path)
+            counts, settings = run(path, pragmas, args.seconds, args.writers, args.readers)
+        print(f"{label:8} 写 {counts['write'] / args.seconds:8.1f}/s  "
+              f"读 {counts['read'] / args.seconds:8.1f}/s  "
+              f"locked {counts['locked']:5d}  {settings}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+进程内缓存
+
+写操作调用 bump() 提升数据版本号，旧版本的缓存项随即作废；
+另有 TTL 兜底，多进程部署时其他进程的写入最多延迟 ttl 秒可见。
+VersionedCache 缓存统计数据，FragmentCache 缓存渲染好的列表表格。
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class VersionedCache:
+    """按数据版本号失效、带 TTL 兜底的进程内缓存"""
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._version = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self._version
+
+    def bump(self):
+        """数据已变化：提升版本号并清空缓存"""
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def get_or_compute(self, key, compute):
+        """命中且未过期时直接返回缓存值，否则调用 compute() 重新计算"""
+        now = time.monotonic()
+        with self._lock:
+            version = self._version
+            entry = self._entries.get(key)
+        if entry is not None:
+            stored_version, stored_at, value = entry
+            if stored_version == version and now - stored_at < self.ttl:
+                return value
+
+        value = compute()
+
+        # 计算期间如有写入（版本号已变），结果可能是旧数据，不放进缓存
+        with self._lock:
+            if self._version == version:
+                self._entries[key] = (version, now, value)
+        return value
+
+
+class FragmentCache:
+    """渲染好的页面片段（HTML）缓存
+
+    每个片段声明自己依赖的表，写操作调用 bump(表名...) 提升这些表的数据版本号，
+    依赖它们的片段随即作废；另有 TTL 兜底（多进程部署时其他进程的写入）。
+    按最近最少使用淘汰，片段总大小不超过 max_bytes。
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=30):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._versions = {}
+        self._entries = OrderedDict()  # key -> (依赖的表, 版本号, 存入时间, 大小, 片段)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def bump(self, *tables):
+        """这些表的数据已变化：提升版本号并丢弃依赖它们的片段"""
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+            for key in [k for k, entry in self._entries.items() if set(entry[0]) & set(tables)]:
+                self._discard(key)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key)
+        self.size -= entry[3]
+
+    def get_or_render(self, tables, key, render):
+        """命中且未过期时直接返回片段，否则调用 render() 渲染并存入"""
+        now = time.monotonic()
+        with self._lock:
+            versions = tuple(self._versions.get(table, 0) for table in tables)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] == versions and now - entry[2] < self.ttl:
+                    self._entries.move_to_end(key)
+                    return entry[4]
+                self._discard(key)
+
+        value = render()
+        size = sys.getsizeof(value)
+        if size > self.max_bytes:
+            return value
+
+        with self._lock:
+            # 渲染期间如有写入（版本号已变），片段可能是旧数据，不放进缓存
+            if tuple(self._versions.get(table, 0) for table in tables) != versions:
+                return value
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (tuple(tables), versions, now, size, value)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+        return value
@@ -0,0 +1,130 @@
+"""
+数据变更日志（用于按时间点恢复）
+
+应用对数据库执行的每条写语句（INSERT/UPDATE/DELETE/REPLACE，连同参数）按事务
+追加到日志目录下按天分的文件 changes-YYYYMMDD.jsonl，每个事务一行：
+
+    {"tx": 事务号, "prev": 上一个事务号, "ts": 提交时间,
+     "statements": [[SQL, 参数, 是否 executemany], ...]}
+
+executemany 的参数是多行（每行一个列表），否则是一行。日志在提交成功之后才追加，
+提交失败或回滚的事务不会出现在日志里。提交之前（仍持有 SQLite 的写锁）在同一事务里
+读出 system_state 的 journal_position 作为 prev、再把本事务号写进去：任何备份都记得
+自己包含到哪个事务，多进程部署时日志行的先后可能和提交顺序略有出入，恢复时
+（backup_database.py restore-pitr）沿 prev 链按提交顺序重放。
+
+建表、加列等结构变更不记录；执行 flask init-db 升级之后应重新做一次备份。
+"""
+
+import base64
+import datetime
+import json
+import os
+import sqlite3
+import time
+
+from sqlalchemy import event
+
+POSITION_KEY = 'journal_position'
+
+WRITE_KEYWORDS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+_PREV_SQL = "SELECT value FROM system_state WHERE key = ?"
+
+_POSITION_SQL = (
+    "INSERT INTO system_state (key, value, updated_at) VALUES (?, ?, ?) "
+    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at"
+)
+
+
+def journal_file(directory, day):
+    return os.path.join(directory, f"changes-{day.strftime('%Y%m%d')}.jsonl")
+
+
+def _encode(value):
+    """参数中 JSON 不能直接表示的值；bytes 记为 {"$b": base64}"""
+    if isinstance(value, bytes):
+        return {'$b': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(' ')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError(f'无法记录的参数类型: {type(value).__name__}')
+
+
+def install(engine, directory):
+    """为 SQLite 引擎注册事件，记录之后每个提交的事务中的写语句"""
+    if engine.dialect.name != 'sqlite' or not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip()[:7].upper().startswith(WRITE_KEYWORDS):
+            return
+        # 按实际执行的形状记录：insertmanyvalues 把 executemany 拆成逐行 execute 时，
+        # executemany 仍为 True，但参数只是一行
+        if executemany and parameters and all(isinstance(row, (list, tuple)) for row in parameters):
+            params, many = [list(row) for row in parameters], True
+        else:
+            params, many = list(parameters or ()), False
+        conn.info.setdefault('journal', []).append([statement, params, many])
+
+    @event.listens_for(engine, 'savepoint')
+    def mark_savepoint(conn, name):
+        conn.info.setdefault('journal_savepoints', {})[name] = len(conn.info.get('journal', []))
+
+    @event.listens_for(engine, 'rollback_savepoint')
+    def discard_savepoint(conn, name, context):
+        mark = conn.info.get('journal_savepoints', {}).pop(name, None)
+        if mark is not None:
+            del conn.info.get('journal', [])[mark:]
+
+    @event.listens_for(engine, 'rollback')
+    def discard(conn):
+        conn.info.pop('journal', None)
+        conn.info.pop('journal_savepoints', None)
+        conn.info.pop('journal_line', None)
+
+    @event.listens_for(engine, 'commit')
+    def write_journal(conn):
+        statements = conn.info.pop('journal', None)
+        conn.info.pop('journal_savepoints', None)
+        if not statements:
+            return
+        now = datetime.datetime.now()
+        tx = f'{time.time_ns()}-{os.getpid()}'
+
+        # 与本事务一起提交：备份里记下它包含到哪个事务（直接用驱动游标，不经过上面的记录）
+        prev = None
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            row = cursor.execute(_PREV_SQL, (POSITION_KEY,)).fetchone()
+            prev = row[0] if row else None
+            cursor.execute(_POSITION_SQL, (POSITION_KEY, tx, now.isoformat(' ')))
+        except sqlite3.OperationalError:
+            pass  # 还没有执行 flask init-db
+        finally:
+            cursor.close()
+
+        conn.info['journal_line'] = (journal_file(directory, now), json.dumps(
+            {'tx': tx, 'prev': prev, 'ts': now.isoformat(), 'statements': statements},
+            ensure_ascii=False, default=_encode) + '\n')
+
+    # 'commit' 事件在驱动提交之前触发，SQLAlchemy 没有提交之后的引擎事件，
+    # 所以包一层方言的 do_commit：驱动提交成功之后才追加日志，失败则丢弃
+    do_commit = engine.dialect.do_commit
+
+    def commit_and_append(dbapi_connection):
+        pending = dbapi_connection.info.pop('journal_line', None)
+        do_commit(dbapi_connection)
+        if pending:
+            path, line = pending
+            # O_APPEND 加一次 write：多进程同时追加也不会交错
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode('utf-8'))
+            finally:
+                os.close(fd)
+
+    engine.dialect.do_commit = commit_and_append
@@ -5,5 +5,48 @@ load_dotenv()
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-key-please-change-in-production')
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///devices.db'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///devices.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # 统计数据和表格片段缓存的最长有效期（秒），多进程部署时其他进程的写入最多延迟这么久可见
+    STATS_CACHE_TTL = 30
+    # 设备列表、借用记录表格片段缓存的总大小上限（字节），按最近最少使用淘汰
+    FRAGMENT_CACHE_MAX_BYTES = int(os.getenv('FRAGMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+    # SQLite 连接参数，每个新连接都会设置（见 sqlite_tuning.py），设为 None 则不设置该项
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))  # 毫秒
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', -32000))  # 负数表示 KiB，约 32MB
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # 字节
+    SQLITE_TEMP_STORE = os.getenv('SQLITE_TEMP_STORE', 'MEMORY')
+    SQLITE_FOREIGN_KEYS = True
+    SQLITE_AUTO_VACUUM = os.getenv('SQLITE_AUTO_VACUUM', 'INCREMENTAL')  # 已有数据库由 flask init-db 转换
+
+    # 数据变更日志（见 change_journal.py），用于 backup_database.py 按时间点恢复；
+    # 目录默认为 instance/journal，与数据库和 backup/ 放在一起
+    CHANGE_JOURNAL = os.getenv('CHANGE_JOURNAL', '1') == '1'
+    CHANGE_JOURNAL_DIR = os.getenv('CHANGE_JOURNAL_DIR')
+
+    # 定期维护（flask maintenance 常驻进程，见 maintenance.py）：各任务的间隔（秒），0 表示不执行
+    MAINTENANCE_CHECKPOINT_INTERVAL = int(os.getenv('MAINTENANCE_CHECKPOINT_INTERVAL', 300))
+    MAINTENANCE_ANALYZE_INTERVAL = int(os.getenv('MAINTENANCE_ANALYZE_INTERVAL', 24 * 3600))
+    MAINTENANCE_VACUUM_INTERVAL = int(os.getenv('MAINTENANCE_VACUUM_INTERVAL', 24 * 3600))
+    MAINTENANCE_BACKUP_INTERVAL = int(os.getenv('MAINTENANCE_BACKUP_INTERVAL', 6 * 3600))
+    MAINTENANCE_UTILIZATION_INTERVAL = int(os.getenv('MAINTENANCE_UTILIZATION_INTERVAL', 3600))
+    MAINTENANCE_OVERDUE_INTERVAL = int(os.getenv('MAINTENANCE_OVERDUE_INTERVAL', 3600))
+    # 数据库连续这么多秒没有写入才算空闲；任务到期后最多推迟 MAX_DELAY 秒，之后不再等空闲
+    MAINTENANCE_QUIET_SECONDS = int(os.getenv('MAINTENANCE_QUIET_SECONDS', 30))
+    MAINTENANCE_MAX_DELAY = int(os.getenv('MAINTENANCE_MAX_DELAY', 3600))
+    MAINTENANCE_POLL_SECONDS = 5
+    MAINTENANCE_VACUUM_PAGES = 256  # 增量 VACUUM 每步回收的页数
+    MAINTENANCE_VACUUM_SLEEP = 0.05  # 每步之间的暂停（秒）
+    MAINTENANCE_BACKUP_DIR = os.getenv('MAINTENANCE_BACKUP_DIR')  # 默认 instance/backup
+    MAINTENANCE_BACKUP_KEEP_DAYS = int(os.getenv('MAINTENANCE_BACKUP_KEEP_DAYS', 30))
+
+    # 生产服务器（serve.py / gunicorn.conf.py）
+    SERVER_BIND = os.getenv('SERVER_BIND', '0.0.0.0:5000')
+    SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', 2))  # 进程数（waitress 只有一个进程）
+    SERVER_THREADS = int(os.getenv('SERVER_THREADS', 4))  # 每个进程的线程数
+    SERVER_TIMEOUT = int(os.getenv('SERVER_TIMEOUT', 60))  # 单个请求的超时（秒）
+    SERVER_GRACEFUL_TIMEOUT = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', 30))  # 停止时等待进行中请求的时间（秒）
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""
+CSV 流式导出
+
+边查询边输出：每写满一批行就把这部分文本交给响应，
+客户端立即开始接收数据，服务端内存不随导出行数增长。
+"""
+
+import csv
+import io
+
+# Excel 需要 BOM 才能正确识别 UTF-8 编码的中文表头
+UTF8_BOM = '\ufeff'
+
+
+def stream_csv(header, rows, flush_every=500):
+    """逐块产出 CSV 文本，rows 为可迭代的行（列表或元组）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(header)
+    yield UTF8_BOM + buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= flush_every:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+
+    if pending:
+        yield buffer.getvalue()
+
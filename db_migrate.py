@@ -0,0 +1,95 @@
+"""
+数据库结构迁移工具
+
+db.create_all() 只会创建缺失的表，不会给已有的表加列或补建索引，
+已有数据库需要用这里的函数补齐模型中新增的列和索引。
+补齐只执行 ALTER TABLE ADD COLUMN / CREATE INDEX，不会删除数据。
+"""
+
+from sqlalchemy import inspect, text
+
+
+def explain_query_plan(engine, query):
+    """返回查询在 SQLite 下的 EXPLAIN QUERY PLAN 明细行"""
+    statement = query.statement if hasattr(query, 'statement') else query
+    compiled = statement.compile(dialect=engine.dialect,
+                                 compile_kwargs={'render_postcompile': True})
+    params = compiled.params
+    if compiled.positiontup is not None:
+        params = tuple(params[name] for name in compiled.positiontup)
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def print_query_plans(engine, queries, title):
+    """打印一组 (说明, 查询) 的执行计划"""
+    print("=" * 70)
+    print(title)
+    print("=" * 70)
+    for label, query in queries:
+        print(f"- {label}")
+        for detail in explain_query_plan(engine, query):
+            print(f"    {detail}")
+    print()
+
+
+def missing_indexes(engine, metadata):
+    """列出模型中声明、但数据库里还没有的索引"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in metadata.tables.values():
+        if table.name not in existing_tables:
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda ix: ix.name):
+            if index.name not in existing:
+                missing.append(index)
+    return missing
+
+
+def create_missing_indexes(engine, metadata):
+    """补建缺失的索引，返回新建的索引名列表"""
+    created = []
+    with engine.begin() as conn:
+        for index in missing_indexes(engine, metadata):
+            index.create(conn, checkfirst=True)
+            created.append(index.name)
+    # 连接上缓存的 EXPLAIN 语句不会因为新索引重新规划，丢弃旧连接
+    engine.dispose()
+    return created
+
+
+def missing_columns(engine, metadata):
+    """列出模型中声明、但已有表里还没有的列"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in metadata.tables.values():
+        if table.name not in existing_tables:
+            continue
+        existing = {col['name'] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                missing.append(column)
+    return missing
+
+
+def add_missing_columns(engine, metadata):
+    """给已有的表补加缺失的列，返回新加的 '表.列' 列表
+
+    SQLite 的 ADD COLUMN 不能带非空约束或非常量默认值，新列一律按可空添加，
+    需要初始值的列由调用方随后回填。
+    """
+    added = []
+    with engine.begin() as conn:
+        for column in missing_columns(engine, metadata):
+            column_type = column.type.compile(dialect=engine.dialect)
+            conn.execute(text(
+                f'ALTER TABLE "{column.table.name}" ADD COLUMN "{column.name}" {column_type}'
+            ))
+            added.append(f'{column.table.name}.{column.name}')
+    if added:
+        engine.dispose()
+    return added
@@ -0,0 +1,264 @@
+"""
+设备批量导入（CSV / XLSX）
+
+逐行读取文件并校验，校验通过的行按批写入：每批一条
+INSERT ... ON CONFLICT(number) DO UPDATE（executemany）加一次提交，
+设备编号已存在的更新、不存在的新增。校验失败的行不写入，
+连同行号和原因记入导入报告。
+
+表头可以用导出文件的中文列名，也可以用字段名；文件里没有的列不会被修改。
+CSV 按 UTF-8 读取，不是合法的 UTF-8 时按 GB18030 读取（中文版 Excel 另存的 CSV）。
+XLSX 需要安装 openpyxl。模型类由调用方传入，避免与 app.py 循环导入。
+"""
+
+import codecs
+import csv
+import io
+import zipfile
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+from sqlalchemy import case, select
+from sqlalchemy.dialects.sqlite import insert
+
+# 每批写入（并提交）的行数
+IMPORT_BATCH_SIZE = 1000
+
+# 导入时允许的设备状态；借用中只能由借用操作产生
+IMPORT_STATUSES = ('正常', '维修中', '停用')
+
+# 表头 -> 字段名（与导出的中文列名一致）
+HEADER_ALIASES = {
+    '设备名称': 'name',
+    '设备编号': 'number',
+    '设备型号': 'model',
+    '设备信息': 'info',
+    '校准日期': 'calibration_date',
+    '所在地': 'location',
+    '管理人': 'manager',
+    '状态': 'status',
+}
+IMPORT_FIELDS = tuple(HEADER_ALIASES.values())
+FIELD_LABELS = {v: k for k, v in HEADER_ALIASES.items()}
+REQUIRED_FIELDS = ('name', 'number', 'calibration_date')
+
+DATE_FORMATS = ('%Y-%m-%d', '%Y/%m/%d', '%Y.%m.%d')
+
+# 依次尝试的 CSV 编码
+CSV_ENCODINGS = ('utf-8-sig', 'gb18030')
+
+
+class ImportFileError(ValueError):
+    """文件无法导入（格式不支持、缺少必需的列等）"""
+
+
+@dataclass
+class ImportReport:
+    """导入结果"""
+    total: int = 0
+    inserted: int = 0
+    updated: int = 0
+    committed: int = 0  # 已写入并提交的行数
+    errors: list = field(default_factory=list)  # [(行号, 设备编号, 原因), ...]
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+    def to_dict(self):
+        return {
+            'total': self.total,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'committed': self.committed,
+            'failed': self.failed,
+            'errors': [{'row': row, 'number': number, 'message': message}
+                       for row, number, message in self.errors],
+        }
+
+
+def _decodes(stream, encoding, chunk_size=1 << 16):
+    """整个文件能否按 encoding 解码（读完后回到开头）"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            decoder.decode(chunk, final=not chunk)
+            if not chunk:
+                return True
+    except UnicodeDecodeError:
+        return False
+    finally:
+        stream.seek(0)
+
+
+def _csv_encoding(stream):
+    """在写入任何一行之前确定编码，避免导入到一半才遇到解码错误"""
+    if not stream.seekable():
+        return CSV_ENCODINGS[0]
+    for encoding in CSV_ENCODINGS:
+        if _decodes(stream, encoding):
+            return encoding
+    raise ImportFileError('无法识别文件编码，请另存为 UTF-8 编码的 CSV')
+
+
+def _read_csv(stream):
+    text = io.TextIOWrapper(stream, encoding=_csv_encoding(stream), newline='')
+    yield from csv.reader(text)
+
+
+def _read_xlsx(stream):
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise ImportFileError('导入 XLSX 文件需要安装 openpyxl')
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError):
+        raise ImportFileError('文件不是有效的 XLSX 文件（已损坏，或是改了扩展名的其他格式）')
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield ['' if value is None else value for value in row]
+    finally:
+        workbook.close()
+
+
+def _checked(rows):
+    """读取过程中的解码、CSV 格式错误转成 ImportFileError"""
+    try:
+        yield from rows
+    except UnicodeDecodeError:
+        raise ImportFileError('无法识别文件编码，请另存为 UTF-8 编码的 CSV')
+    except csv.Error as e:
+        raise ImportFileError(f'CSV 格式错误：{e}')
+
+
+def read_rows(stream, filename):
+    """按扩展名读取 CSV/XLSX，逐行产出 (行号, {字段名: 原始值})
+
+    文件无法读取（编码无法识别、XLSX 损坏、CSV 格式错误等）时抛出 ImportFileError。
+    """
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        rows = _checked(_read_csv(stream))
+    elif name.endswith('.xlsx'):
+        rows = _checked(_read_xlsx(stream))
+    else:
+        raise ImportFileError('只支持 .csv 和 .xlsx 文件')
+
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError('文件为空')
+    fields = [HEADER_ALIASES.get(str(h).strip(), str(h).strip()) for h in header]
+    missing = [f for f in REQUIRED_FIELDS if f not in fields]
+    if missing:
+        raise ImportFileError('缺少必需的列：' + '、'.join(FIELD_LABELS[f] for f in missing))
+
+    columns = [(i, f) for i, f in enumerate(fields) if f in IMPORT_FIELDS]
+    for line_no, row in enumerate(rows, start=2):
+        if not any(str(v).strip() for v in row):
+            continue
+        yield line_no, {f: row[i] if i < len(row) else '' for i, f in columns}
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def validate_row(Device, raw):
+    """校验并转换一行，返回 (字段值, 错误信息)，有错误时字段值为 None"""
+    values = {}
+    for name, value in raw.items():
+        if name == 'calibration_date':
+            continue
+        text = str(value).strip()
+        values[name] = text or None
+
+    if not values.get('number'):
+        return None, '设备编号不能为空'
+    if not values.get('name'):
+        return None, '设备名称不能为空'
+
+    calibration_date = _parse_date(raw['calibration_date'])
+    if calibration_date is None:
+        return None, f"校准日期格式错误：{raw['calibration_date']}"
+    values['calibration_date'] = calibration_date
+
+    if 'status' in values:
+        values['status'] = values['status'] or '正常'
+        if values['status'] not in IMPORT_STATUSES:
+            return None, f"状态只能是{'、'.join(IMPORT_STATUSES)}：{values['status']}"
+
+    for name, value in values.items():
+        length = getattr(Device.__table__.c[name].type, 'length', None)
+        if length and isinstance(value, str) and len(value) > length:
+            return None, f'{FIELD_LABELS[name]}超过 {length} 个字符'
+    return values, None
+
+
+def _upsert_statement(Device, columns):
+    """按设备编号插入或更新；借用中的设备保留原状态"""
+    stmt = insert(Device)
+    updates = {name: stmt.excluded[name] for name in columns if name != 'number'}
+    if 'status' in updates:
+        updates['status'] = case((Device.status == '借用中', Device.status),
+                                 else_=stmt.excluded.status)
+    updates['updated_at'] = datetime.utcnow()
+    return stmt.on_conflict_do_update(index_elements=['number'], set_=updates)
+
+
+def _write_batch(session, Device, batch, report, dry_run):
+    numbers = [values['number'] for values in batch]
+    existing = set(session.scalars(select(Device.number).where(Device.number.in_(numbers))))
+    report.updated += len(existing)
+    report.inserted += len(batch) - len(existing)
+    if dry_run:
+        return
+
+    columns = list(batch[0])
+    session.execute(_upsert_statement(Device, columns), batch)
+    session.commit()
+    report.committed += len(batch)
+
+
+def import_devices(session, Device, rows, batch_size=IMPORT_BATCH_SIZE, dry_run=False,
+                   report=None):
+    """导入 read_rows() 产出的行，返回 ImportReport
+
+    每批一次 executemany 并提交；dry_run 时只校验、统计，不写入。
+    同一文件中重复的设备编号只导入第一次出现的行。
+    传入 report 时结果累计在其中：中途出错时，之前的批次已经提交，
+    调用方可以从 report.committed 得知写入了多少行。
+    """
+    report = report if report is not None else ImportReport()
+    seen = set()
+    batch = []
+    for line_no, raw in rows:
+        report.total += 1
+        values, error = validate_row(Device, raw)
+        if error is None and values['number'] in seen:
+            error = '设备编号在文件中重复'
+        if error:
+            report.errors.append((line_no, str(raw.get('number', '')).strip(), error))
+            continue
+
+        seen.add(values['number'])
+        batch.append(values)
+        if len(batch) >= batch_size:
+            _write_batch(session, Device, batch, report, dry_run)
+            batch = []
+
+    if batch:
+        _write_batch(session, Device, batch, report, dry_run)
+    return report
@@ -0,0 +1,46 @@
+"""
+gunicorn 配置（Linux 生产环境）
+
+    gunicorn -c gunicorn.conf.py app:app
+或
+    python serve.py --workers 4 --threads 4
+
+参数取自 config.Config 的 SERVER_* 设置（可用同名环境变量覆盖）。
+主进程预先导入应用（preload_app），工作进程 fork 后丢弃继承来的数据库连接池，
+各自建立自己的连接；收到 SIGTERM 后等待进行中的请求完成（graceful_timeout）再退出。
+"""
+
+from config import Config
+
+bind = Config.SERVER_BIND
+workers = Config.SERVER_WORKERS
+threads = Config.SERVER_THREADS
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = Config.SERVER_TIMEOUT
+graceful_timeout = Config.SERVER_GRACEFUL_TIMEOUT
+keepalive = 5
+
+# 定期重启工作进程，避免内存缓慢增长；加随机量防止同时重启
+max_requests = 2000
+max_requests_jitter = 200
+
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """fork 得到的连接与主进程共享文件句柄，子进程中不能继续使用"""
+    from app import app
+    from database import db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    """工作进程退出前关闭数据库连接（最后一个连接关闭时 SQLite 会做 WAL 检查点）"""
+    from app import app
+    from database import db
+    with app.app_context():
+        db.engine.dispose()
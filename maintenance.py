@@ -0,0 +1,175 @@
+"""
+数据库定期维护：增量备份、ANALYZE、增量 VACUUM、WAL 检查点、使用率日汇总、超期标记
+
+由 flask maintenance 常驻进程按配置的间隔执行（见 config.Config 的 MAINTENANCE_* 设置），
+只在数据库空闲（一段时间内没有其他连接提交写入）时运行，每项任务都分小步进行，
+不会长时间持有锁而拖慢请求。各任务的上次运行情况记在 system_state 中，
+在"系统管理 - 数据维护"页面查看。维护进程的心跳写在 instance 目录下的文件里，
+不写数据库（否则每次心跳都是一次提交，会进入变更日志和增量备份）。
+"""
+
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import backup_database
+
+# 任务名 -> 页面上显示的名称，按此顺序检查和执行
+JOBS = {
+    'checkpoint': 'WAL 检查点',
+    'analyze': '更新统计信息（ANALYZE）',
+    'vacuum': '增量 VACUUM',
+    'backup': '增量备份',
+    'utilization': '使用率日汇总',
+    'overdue': '标记超期未还',
+}
+
+STATE_PREFIX = 'maintenance:'
+HEARTBEAT_FILE = 'maintenance.heartbeat'
+
+
+class ActivityMonitor:
+    """用 PRAGMA data_version 判断数据库最近是否有其他连接提交过写入
+
+    data_version 在其他连接（包括其他进程）提交后变化，本连接自己的写入不影响它。
+    """
+
+    def __init__(self, db_file):
+        self._conn = sqlite3.connect(db_file, isolation_level=None, check_same_thread=False)
+        self._version = self._read()
+        self._changed_at = time.monotonic()
+
+    def _read(self):
+        return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def poll(self):
+        version = self._read()
+        if version != self._version:
+            self._version = version
+            self._changed_at = time.monotonic()
+
+    def ignore_changes(self):
+        """维护任务自己的写入不算作业务活动"""
+        self._version = self._read()
+
+    def quiet_for(self):
+        """距上次写入活动的秒数"""
+        self.poll()
+        return time.monotonic() - self._changed_at
+
+    def close(self):
+        self._conn.close()
+
+
+def due_jobs(intervals, last_runs, now):
+    """到期的任务：间隔为 0 的不执行，从未运行过的立即到期"""
+    due = []
+    for name in JOBS:
+        interval = intervals.get(name) or 0
+        if interval <= 0:
+            continue
+        last = last_runs.get(name)
+        if last is None or (now - last).total_seconds() >= interval:
+            due.append(name)
+    return due
+
+
+def overdue(name, intervals, last_runs, now, started_at, max_delay):
+    """到期后又推迟了超过 max_delay 秒（数据库一直繁忙），不再等空闲
+
+    从未运行过的任务从维护进程启动时（started_at）算起。
+    """
+    last = last_runs.get(name)
+    if last is None:
+        return (now - started_at).total_seconds() > max_delay
+    return (now - last).total_seconds() > intervals[name] + max_delay
+
+
+def wal_checkpoint(conn, busy_timeout=100):
+    """把 WAL 写回数据库文件并截断 WAL；有读者占用时只做能做的部分，最多等待 busy_timeout 毫秒"""
+    conn.execute(f'PRAGMA busy_timeout={busy_timeout}')
+    busy, log_pages, checkpointed = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+    if log_pages < 0:
+        return '不是 WAL 模式，跳过'
+    if busy:
+        return f'有读者占用，已写回 {checkpointed}/{log_pages} 页'
+    return f'已写回 {checkpointed} 页，WAL 已截断'
+
+
+def analyze(conn, analysis_limit=1000):
+    """更新查询优化器的统计信息；analysis_limit 限制每个索引扫描的行数，大表上也只需很短时间"""
+    conn.execute(f'PRAGMA analysis_limit={analysis_limit}')
+    started = time.monotonic()
+    conn.execute('ANALYZE')
+    return f'用时 {time.monotonic() - started:.2f} 秒'
+
+
+def incremental_vacuum(conn, pages=256, sleep=0.05, max_seconds=30):
+    """分小步回收空闲页，每步单独提交并暂停，让其他写入可以插进来"""
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return '数据库未启用 auto_vacuum=INCREMENTAL（执行 flask init-db 转换），跳过'
+    free_before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    deadline = time.monotonic() + max_seconds
+    while conn.execute('PRAGMA freelist_count').fetchone()[0] > 0 and time.monotonic() < deadline:
+        # execute() 只执行一步（每步回收一页），executescript() 才会执行到底
+        conn.executescript(f'PRAGMA incremental_vacuum({pages});')
+        time.sleep(sleep)
+    free_after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    return f'回收 {free_before - free_after} 页，剩余空闲页 {free_after}'
+
+
+def backup(db_file, backup_dir, journal_dir, keep_days=30):
+    """增量备份（在线复制本身按页分步、带暂停），并清理过期快照和日志"""
+    if not backup_database.incremental_backup(db_file, backup_dir):
+        raise RuntimeError('增量备份失败，详见日志')
+    backup_database.prune_snapshots(backup_dir, days_to_keep=keep_days)
+    backup_database.prune_journal(backup_dir, journal_dir)
+    latest = backup_database.load_snapshots(backup_dir)[0]
+    return f"快照 {latest['name']}，{latest['size'] / 1024:.0f} KB"
+
+
+def run_job(name, db_file, settings):
+    """执行一项数据库任务，返回结果说明（使用率日汇总和超期标记需要模型，由 app.py 执行）"""
+    if name == 'backup':
+        return backup(db_file, settings['backup_dir'], settings['journal_dir'],
+                      settings['backup_keep_days'])
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    try:
+        if name == 'checkpoint':
+            return wal_checkpoint(conn)
+        if name == 'analyze':
+            return analyze(conn)
+        if name == 'vacuum':
+            return incremental_vacuum(conn, settings['vacuum_pages'], settings['vacuum_sleep'])
+        raise ValueError(f'未知的维护任务: {name}')
+    finally:
+        conn.close()
+
+
+def lower_priority():
+    """降低本进程的 CPU 优先级（仅类 Unix），维护任务不和请求抢 CPU"""
+    if hasattr(os, 'nice'):
+        try:
+            os.nice(10)
+        except OSError:
+            pass
+
+
+def write_heartbeat(path):
+    """更新心跳文件的修改时间"""
+    with open(path, 'a'):
+        pass
+    os.utime(path)
+
+
+def read_heartbeat(path):
+    """最近一次心跳的时间，没有心跳文件时返回 None"""
+    try:
+        return datetime.fromtimestamp(os.path.getmtime(path))
+    except OSError:
+        return None
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value) if value else None
@@ -1,66 +1,262 @@
-from database import db
-from flask_login import UserMixin
+"""
+数据模型
+
+全部模型集中在这里，app.py 和命令行工具都从这里导入。
+"""
+
 from datetime import datetime
 
-class User(UserMixin, db.Model):
+from flask_login import UserMixin
+
+from database import db
+
+
+class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
-    role = db.Column(db.String(20), default='user')  # admin, user
+    role = db.Column(db.String(20), default='user')
+    active = db.Column(db.Boolean, default=True)  # 添加 active 字段
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 添加以下字段用于邀请码系统
+    real_name = db.Column(db.String(100))  # 真实姓名
+    department = db.Column(db.String(100))  # 部门
+    invitation_code_id = db.Column(db.Integer, db.ForeignKey('invitation_code.id'))  # 邀请码ID
+
+    # 关联关系
+    invitation_code = db.relationship('InvitationCode', foreign_keys=[invitation_code_id])
+
+    # Flask-Login 需要的属性
+    @property
+    def is_active(self):
+        return self.active
+    
+    @property
+    def is_authenticated(self):
+        return True
+    
+    @property
+    def is_anonymous(self):
+        return False
+    
+    def get_id(self):
+        return str(self.id)
     
     def __repr__(self):
         return f'<User {self.username}>'
 
+
+class InvitationCode(db.Model):
+    """邀请码模型"""
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(50), unique=True, nullable=False)  # 邀请码
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # 创建人ID
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # 创建时间
+    expires_at = db.Column(db.DateTime)  # 过期时间
+    max_uses = db.Column(db.Integer, default=1)  # 最大使用次数
+    used_count = db.Column(db.Integer, default=0)  # 已使用次数
+    is_active = db.Column(db.Boolean, default=True)  # 是否有效
+    notes = db.Column(db.Text)  # 备注
+
+    # 关联关系
+    creator = db.relationship('User', foreign_keys=[created_by])
+
+    def __repr__(self):
+        return f'<InvitationCode {self.code}>'
+
+    @property
+    def is_expired(self):
+        """检查是否过期"""
+        if self.expires_at:
+            return datetime.utcnow() > self.expires_at
+        return False
+
+    @property
+    def can_use(self):
+        """检查是否可以使用"""
+        return (self.is_active and
+                not self.is_expired and
+                self.used_count < self.max_uses)
+
+    @property
+    def status(self):
+        """获取状态文本"""
+        if not self.is_active:
+            return '已禁用'
+        if self.is_expired:
+            return '已过期'
+        if self.used_count >= self.max_uses:
+            return '已用完'
+        return '有效'
+
 class Device(db.Model):
+    # 地点筛选、地点+状态筛选以及地点下拉列表（覆盖索引）
+    __table_args__ = (
+        db.Index('ix_device_location_status', 'location', 'status'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(200), nullable=False)
+    name = db.Column(db.String(200), nullable=False, index=True)
     number = db.Column(db.String(100), unique=True, nullable=False)
-    model = db.Column(db.String(100))
+    model = db.Column(db.String(100), index=True)
     info = db.Column(db.Text)
-    calibration_date = db.Column(db.Date, nullable=False)
+    calibration_date = db.Column(db.Date, nullable=False, index=True)
     location = db.Column(db.String(200))
     manager = db.Column(db.String(100))
-    status = db.Column(db.String(20), default='正常')  # 正常, 维修中, 停用
+    status = db.Column(db.String(20), default='正常', index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<Device {self.name} - {self.number}>'
+
+    def to_dict(self):
+        """变更同步接口使用的字段"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'number': self.number,
+            'model': self.model,
+            'info': self.info,
+            'calibration_date': self.calibration_date.strftime('%Y-%m-%d'),
+            'location': self.location,
+            'manager': self.manager,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+# 尚未归还的借用状态（超期未还的设备仍在借出中）
+ACTIVE_BORROW_STATUSES = ('借用中', '超期未还')
+
 
 class BorrowRecord(db.Model):
-    """设备借用记录"""
-    id = db.Column(db.Integer, primary_key=True)
-    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=False)
-    borrower_name = db.Column(db.String(100), nullable=False)  # 借用人姓名
-    borrower_department = db.Column(db.String(100))  # 借用人部门
-    borrower_contact = db.Column(db.String(50))  # 联系方式
-    borrow_date = db.Column(db.Date, nullable=False)  # 借用日期
-    expected_return_date = db.Column(db.Date)  # 预计归还日期
-    actual_return_date = db.Column(db.Date)  # 实际归还日期
-    borrow_purpose = db.Column(db.Text)  # 借用用途
-    borrow_notes = db.Column(db.Text)  # 借用备注
-    status = db.Column(db.String(20), default='借用中')  # 借用中、已归还、超期未还
-    approver = db.Column(db.String(100))  # 审批人
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))  # 记录创建人
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # 按状态统计/筛选，以及借用中记录按预计归还日期查超期
+    # 借用记录页按状态筛选后按创建时间倒序分页
+    __table_args__ = (
+        db.Index('ix_borrow_record_status_expected_return_date', 'status', 'expected_return_date'),
+        db.Index('ix_borrow_record_status_created_at', 'status', 'created_at'),
+    )
 
- # 关联关系
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=False, index=True)
+    borrower_name = db.Column(db.String(100), nullable=False)
+    borrower_department = db.Column(db.String(100))
+    borrower_contact = db.Column(db.String(50))
+    borrow_date = db.Column(db.Date, nullable=False, index=True)
+    expected_return_date = db.Column(db.Date)
+    actual_return_date = db.Column(db.Date)
+    borrow_purpose = db.Column(db.Text)
+    status = db.Column(db.String(20), default='借用中')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
     device = db.relationship('Device', backref='borrow_records')
-    creator = db.relationship('User')
     
     def __repr__(self):
         return f'<BorrowRecord {self.device.name} - {self.borrower_name}>'
-    
+
     @property
     def is_overdue(self):
         """检查是否超期"""
-        if self.status == '借用中' and self.expected_return_date:
+        if self.status in ACTIVE_BORROW_STATUSES and self.expected_return_date:
             return datetime.now().date() > self.expected_return_date
         return False
-    
+
     @property
     def overdue_days(self):
         """计算超期天数"""
         if self.is_overdue:
             return (datetime.now().date() - self.expected_return_date).days
-        return 0
\ No newline at end of file
+        return 0
+
+    def to_dict(self):
+        """变更同步接口使用的字段"""
+        return {
+            'id': self.id,
+            'device_id': self.device_id,
+            'borrower_name': self.borrower_name,
+            'borrower_department': self.borrower_department,
+            'borrower_contact': self.borrower_contact,
+            'borrow_date': self.borrow_date.strftime('%Y-%m-%d'),
+            'expected_return_date': self.expected_return_date.strftime('%Y-%m-%d') if self.expected_return_date else None,
+            'actual_return_date': self.actual_return_date.strftime('%Y-%m-%d') if self.actual_return_date else None,
+            'borrow_purpose': self.borrow_purpose,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+# 单次预约的最长天数；有了这个上限，按开始日期即可在索引上圈定可能重叠的预约
+MAX_RESERVATION_DAYS = 180
+
+
+class Reservation(db.Model):
+    """设备预约（起止日期均包含在内）"""
+    # 按设备 + 开始日期做区间查找，结束日期和状态放进索引避免回表
+    __table_args__ = (
+        db.Index('ix_reservation_device_id_start_date',
+                 'device_id', 'start_date', 'end_date', 'status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)  # 预约开始日期
+    end_date = db.Column(db.Date, nullable=False)  # 预约结束日期
+    borrower_name = db.Column(db.String(100), nullable=False)  # 预约人姓名
+    borrower_department = db.Column(db.String(100))  # 预约人部门
+    purpose = db.Column(db.Text)  # 用途
+    status = db.Column(db.String(20), default='有效')  # 有效、已取消、已借出
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))  # 预约操作人
+    borrow_record_id = db.Column(db.Integer, db.ForeignKey('borrow_record.id'))  # 借出后对应的借用记录
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # 删除设备时连同它的预约一起删除（有效预约由 delete_device 先行拦截）
+    device = db.relationship('Device', backref=db.backref('reservations', cascade='all, delete-orphan'))
+    borrow_record = db.relationship('BorrowRecord')
+
+    def __repr__(self):
+        return f'<Reservation {self.device_id} {self.start_date}~{self.end_date}>'
+
+
+class DeletedRecord(db.Model):
+    """删除记录（墓碑），增量同步据此得知哪些数据已被删除"""
+    __table_args__ = (
+        db.Index('ix_deleted_record_table_name_deleted_at', 'table_name', 'deleted_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)  # 被删除数据所在的表
+    record_id = db.Column(db.Integer, nullable=False)  # 被删除数据的ID
+    record_key = db.Column(db.String(100))  # 业务键，如设备编号
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)  # 删除时间
+
+    def to_dict(self):
+        return {
+            'id': self.record_id,
+            'key': self.record_key,
+            'deleted_at': self.deleted_at.isoformat()
+        }
+
+
+class DeviceUsageDaily(db.Model):
+    """设备使用率日汇总，每台设备每天一行（只记录有借用的日子）"""
+    __table_args__ = (
+        db.Index('ix_device_usage_daily_day', 'day'),
+    )
+
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    borrowed_days = db.Column(db.Integer, nullable=False, default=0)  # 当天是否处于借出状态（0/1）
+    borrow_count = db.Column(db.Integer, nullable=False, default=0)  # 当天新借出次数
+    overdue_days = db.Column(db.Integer, nullable=False, default=0)  # 当天是否超期未还（0/1）
+
+
+class SystemState(db.Model):
+    """系统内部状态（键值对），如使用率汇总已完成到哪一天"""
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.String(200))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,142 @@
+"""
+键集（游标）分页工具
+
+按 (排序列, 主键) 做键集分页：每页只取 per_page + 1 行，
+查询代价与表的大小无关，不使用 OFFSET。
+"""
+
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import tuple_
+
+
+class KeysetPage:
+    """一页查询结果以及前后翻页的游标"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _dump_value(value):
+    """把排序键的值转换为可以放进 JSON 的形式"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _load_value(column, value):
+    """按列类型还原游标中的排序键值"""
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if value is None:
+        return None
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+
+def encode_cursor(direction, values):
+    """生成游标字符串，direction 为 'next' 或 'prev'"""
+    payload = json.dumps([direction] + [_dump_value(v) for v in values],
+                         ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """解析游标字符串，无效时返回 (None, None)"""
+    if not cursor:
+        return None, None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        direction, raw_values = payload[0], payload[1:]
+        if direction not in ('next', 'prev') or len(raw_values) != len(columns):
+            return None, None
+        values = [_load_value(col, v) for col, v in zip(columns, raw_values)]
+    except (ValueError, TypeError, IndexError, UnicodeDecodeError):
+        return None, None
+    return direction, values
+
+
+def keyset_paginate(query, sort_column, id_column, cursor=None, per_page=20, descending=False):
+    """对查询按 (sort_column, id_column) 做键集分页
+
+    sort_column 与 id_column 相同时只按主键排序。
+    返回 KeysetPage。
+    """
+    columns = [sort_column] if sort_column is id_column else [sort_column, id_column]
+    direction, values = decode_cursor(cursor, columns)
+
+    key = tuple_(*columns) if len(columns) > 1 else columns[0]
+    bound = tuple_(*values) if values and len(columns) > 1 else (values[0] if values else None)
+
+    # 向前翻页时反向扫描，取出后再倒序回来
+    backwards = direction == 'prev'
+    scan_desc = descending != backwards
+
+    if values is not None:
+        query = query.filter(key < bound if scan_desc else key > bound)
+
+    # 排序键作为附加列一并取出，排序列可以来自联接的子查询
+    order = [col.desc() if scan_desc else col.asc() for col in columns]
+    rows = query.add_columns(*columns).order_by(*order).limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def cursor_for(direction_, row):
+        return encode_cursor(direction_, list(row[1:]))
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if backwards:
+            next_cursor = cursor_for('next', rows[-1])
+            if has_more:
+                prev_cursor = cursor_for('prev', rows[0])
+        else:
+            if has_more:
+                next_cursor = cursor_for('next', rows[-1])
+            if values is not None:
+                prev_cursor = cursor_for('prev', rows[0])
+
+    return KeysetPage([row[0] for row in rows], per_page,
+                      next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def iter_keyset_batches(query, id_column, batch_size=1000):
+    """按主键分批遍历查询结果，每批一条短查询
+
+    用于导出：不持有长时间打开的游标，内存占用只与 batch_size 有关。
+    逐行产出结果行，行末附加一列主键（_keyset_id），其余列仍可按名称访问。
+    """
+    last_id = None
+    while True:
+        batch_query = query.add_columns(id_column.label('_keyset_id'))
+        if last_id is not None:
+            batch_query = batch_query.filter(id_column > last_id)
+        rows = batch_query.order_by(id_column.asc()).limit(batch_size).all()
+        if not rows:
+            return
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1]._keyset_id
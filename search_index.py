@@ -0,0 +1,146 @@
+"""
+设备全文检索索引（SQLite FTS5）
+
+使用 trigram 分词器：中文名称按字切分，设备编号、型号这类字母数字串
+也能按任意子串命中。索引表是 device 表的外部内容表，由触发器在
+INSERT/UPDATE/DELETE 时同步，不需要应用代码额外维护。
+"""
+
+import re
+
+from sqlalchemy import Float, Integer, text
+from sqlalchemy.exc import OperationalError
+
+FTS_TABLE = 'device_fts'
+FTS_COLUMNS = ('name', 'number', 'model', 'manager')
+
+# trigram 分词器至少需要 3 个字符才能走索引
+MIN_TERM_LENGTH = 3
+
+# None 表示本进程尚未检查过索引表是否存在
+_available = None
+
+_CREATE_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    {', '.join(FTS_COLUMNS)},
+    content='device',
+    content_rowid='id',
+    tokenize='trigram'
+)
+"""
+
+_new_values = ', '.join(f'new.{c}' for c in FTS_COLUMNS)
+_old_values = ', '.join(f'old.{c}' for c in FTS_COLUMNS)
+_column_list = ', '.join(FTS_COLUMNS)
+
+_CREATE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON device BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_column_list}) VALUES (new.id, {_new_values});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON device BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_column_list})
+        VALUES ('delete', old.id, {_old_values});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON device BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_column_list})
+        VALUES ('delete', old.id, {_old_values});
+        INSERT INTO {FTS_TABLE}(rowid, {_column_list}) VALUES (new.id, {_new_values});
+    END
+    """,
+]
+
+
+def is_available(engine=None):
+    """当前数据库是否已经启用全文索引
+
+    本进程还没有执行过 install() 时，传入 engine 则查一次索引表是否存在并记住结果。
+    """
+    global _available
+    if _available is None and engine is not None:
+        _available = _table_exists(engine)
+    return bool(_available)
+
+
+def _table_exists(engine):
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': FTS_TABLE}
+        ).first() is not None
+
+
+def install(engine):
+    """创建全文索引表和同步触发器（已存在时跳过）
+
+    索引表是新建的就顺带从 device 表重建一次索引。
+    SQLite 未编译 FTS5 或版本过低时返回 False，调用方回退到 LIKE 查询。
+    """
+    global _available
+    if engine.dialect.name != 'sqlite':
+        _available = False
+        return False
+
+    try:
+        with engine.begin() as conn:
+            existed = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': FTS_TABLE}
+            ).first() is not None
+            conn.execute(text(_CREATE_TABLE))
+            for ddl in _CREATE_TRIGGERS:
+                conn.execute(text(ddl))
+            if not existed:
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    except OperationalError as e:
+        print(f"⚠ 全文索引不可用，设备搜索将使用普通查询: {e}")
+        _available = False
+        return False
+
+    _available = True
+    return True
+
+
+def rebuild(engine):
+    """从 device 表重建全文索引，返回索引的设备数"""
+    install(engine)
+    if not _available:
+        return 0
+    with engine.begin() as conn:
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+        return conn.execute(text('SELECT COUNT(*) FROM device')).scalar()
+
+
+def build_match_query(search):
+    """把搜索框输入转换为 FTS5 MATCH 表达式
+
+    按空白拆成多个词，各词之间为 AND 关系；任何一个词不足 3 个字符时
+    trigram 索引无法命中，返回 None。
+    """
+    terms = [t for t in re.split(r'\s+', search.strip()) if t]
+    if not terms or any(len(t) < MIN_TERM_LENGTH for t in terms):
+        return None
+    return ' AND '.join('"{}"'.format(t.replace('"', '""')) for t in terms)
+
+
+def match_subquery(search, engine=None):
+    """返回 (id, rank) 子查询，rank 越小越相关；无法使用索引时返回 None"""
+    if not is_available(engine):
+        return None
+    match = build_match_query(search)
+    if match is None:
+        return None
+    return (
+        text(f"SELECT rowid AS id, bm25({FTS_TABLE}) AS rank "
+             f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match")
+        .bindparams(match=match)
+        .columns(id=Integer, rank=Float)
+        .subquery('fts')
+    )
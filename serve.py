@@ -0,0 +1,66 @@
+"""
+生产环境启动入口
+
+    python serve.py [--bind 0.0.0.0:5000] [--workers 4] [--threads 4] [--server gunicorn|waitress]
+
+Linux 上默认用 gunicorn（多进程 + 每进程多线程，配置见 gunicorn.conf.py）；
+Windows 上没有 gunicorn，默认用 waitress（单进程多线程）。
+启动前不会建表，首次部署或升级后请先执行 flask init-db。
+"""
+
+import argparse
+import os
+import sys
+
+from config import Config
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_gunicorn(args):
+    from gunicorn.app.wsgiapp import run
+
+    # 其余设置取自 gunicorn.conf.py，命令行参数优先
+    sys.argv = ['gunicorn', '-c', os.path.join(BASE_DIR, 'gunicorn.conf.py'),
+                '--chdir', BASE_DIR,
+                '--bind', args.bind,
+                '--workers', str(args.workers),
+                '--threads', str(args.threads),
+                '--worker-class', 'gthread' if args.threads > 1 else 'sync',
+                'app:app']
+    run()
+
+
+def run_waitress(args):
+    from waitress import serve
+
+    from app import app
+    from database import db
+
+    try:
+        serve(app, listen=args.bind, threads=args.threads,
+              channel_timeout=Config.SERVER_TIMEOUT)
+    finally:
+        # 停止后关闭数据库连接
+        with app.app_context():
+            db.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='设备管理系统生产服务器')
+    parser.add_argument('--bind', default=Config.SERVER_BIND, help='监听地址，如 0.0.0.0:5000')
+    parser.add_argument('--workers', type=int, default=Config.SERVER_WORKERS,
+                        help='工作进程数（仅 gunicorn）')
+    parser.add_argument('--threads', type=int, default=Config.SERVER_THREADS, help='每个进程的线程数')
+    parser.add_argument('--server', choices=('gunicorn', 'waitress'),
+                        default='waitress' if os.name == 'nt' else 'gunicorn')
+    args = parser.parse_args()
+
+    if args.server == 'gunicorn':
+        run_gunicorn(args)
+    else:
+        run_waitress(args)
+
+
+if __name__ == '__main__':
+    main()
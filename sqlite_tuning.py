@@ -0,0 +1,86 @@
+"""
+SQLite 连接参数（PRAGMA）
+
+每个新建的数据库连接都执行一遍配置中的 PRAGMA：
+- journal_mode=WAL：读写互不阻塞，借还等写操作不再让列表页等待
+- busy_timeout：遇到写锁时等待而不是立即报 "database is locked"
+- synchronous=NORMAL：WAL 模式下每次提交不再同步刷盘，断电最多丢失最近的提交，不会损坏数据库
+- cache_size / mmap_size / temp_store：加大页缓存、用内存映射读取、临时表放内存
+- foreign_keys：启用外键约束
+- auto_vacuum=INCREMENTAL：删除数据后的空闲页可以由维护任务分步回收（见 maintenance.py）；
+  已有的数据库需要执行一次 flask init-db 转换
+
+配置项见 config.Config 中的 SQLITE_* 设置，值为 None 的项不设置。
+"""
+
+from sqlalchemy import event
+
+# (配置项, PRAGMA 名)，按顺序执行；auto_vacuum 只在建表前对新数据库有效，须最先设置，
+# journal_mode 需要在其余设置之前
+PRAGMA_SETTINGS = (
+    ('SQLITE_AUTO_VACUUM', 'auto_vacuum'),
+    ('SQLITE_JOURNAL_MODE', 'journal_mode'),
+    ('SQLITE_BUSY_TIMEOUT', 'busy_timeout'),
+    ('SQLITE_SYNCHRONOUS', 'synchronous'),
+    ('SQLITE_CACHE_SIZE', 'cache_size'),
+    ('SQLITE_MMAP_SIZE', 'mmap_size'),
+    ('SQLITE_TEMP_STORE', 'temp_store'),
+    ('SQLITE_FOREIGN_KEYS', 'foreign_keys'),
+)
+
+
+def pragmas_from_config(config):
+    """从配置（dict 或 Flask config）中取出要设置的 PRAGMA，返回 [(名, 值), ...]"""
+    pragmas = []
+    for key, name in PRAGMA_SETTINGS:
+        value = config.get(key)
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = 'ON' if value else 'OFF'
+        pragmas.append((name, value))
+    return pragmas
+
+
+def install(engine, pragmas):
+    """为引擎注册连接事件，之后新建的每个连接都执行这些 PRAGMA
+
+    非 SQLite 引擎不做任何事。应在引擎建立第一个连接之前调用。
+    """
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    statements = [f'PRAGMA {name}={value}' for name, value in pragmas]
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+def current_pragmas(connection, names=None):
+    """读取连接上各 PRAGMA 的当前值，用于核对配置是否生效"""
+    names = names or [name for _, name in PRAGMA_SETTINGS]
+    return {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar() for name in names}
+
+
+AUTO_VACUUM_MODES = {'NONE': 0, 'FULL': 1, 'INCREMENTAL': 2}
+
+
+def convert_auto_vacuum(engine, mode):
+    """已有数据库的 auto_vacuum 与配置不同时执行一次 VACUUM 转换，返回是否做了转换
+
+    VACUUM 会重写整个数据库文件并在此期间阻塞写入，只在 flask init-db 中调用。
+    """
+    if engine.dialect.name != 'sqlite' or not mode:
+        return False
+    with engine.connect() as conn:
+        if conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() == AUTO_VACUUM_MODES[mode.upper()]:
+            return False
+        conn.exec_driver_sql(f'PRAGMA auto_vacuum={mode}')
+        conn.exec_driver_sql('VACUUM')
+    return True
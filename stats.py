@@ -0,0 +1,113 @@
+"""
+统计数据
+
+设备按状态、借用记录按状态各用一条 GROUP BY 聚合查询算出全部计数，
+仪表板、设备列表、借用记录页和 /api/stats 共用这里的结果；
+设备列表的地点筛选项（附设备数）也在这里统计。
+模型类由调用方传入，避免与 app.py 循环导入。
+"""
+
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+from sqlalchemy import case, func
+
+
+@dataclass(frozen=True)
+class DeviceStats:
+    """设备统计"""
+    total: int = 0
+    normal: int = 0
+    borrowed: int = 0
+    maintenance: int = 0
+    by_status: dict = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class BorrowStats:
+    """借用记录统计"""
+    total: int = 0
+    active: int = 0  # 尚未归还，含超期未还
+    returned: int = 0
+    overdue: int = 0
+    this_month: int = 0
+    by_status: dict = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class Stats:
+    """系统统计（设备 + 借用记录）"""
+    devices: DeviceStats
+    borrows: BorrowStats
+
+    def to_dict(self):
+        """/api/stats 返回的 JSON 结构"""
+        data = asdict(self)
+        data['devices'].pop('by_status')
+        data['borrows'].pop('by_status')
+        return data
+
+
+def _month_range(now):
+    """返回当月第一天和下月第一天"""
+    start = datetime(now.year, now.month, 1)
+    if now.month == 12:
+        end = datetime(now.year + 1, 1, 1)
+    else:
+        end = datetime(now.year, now.month + 1, 1)
+    return start, end
+
+
+def device_stats(session, Device):
+    """一条聚合查询得到各状态的设备数"""
+    rows = session.query(Device.status, func.count(Device.id)).group_by(Device.status).all()
+    by_status = {status: count for status, count in rows}
+    return DeviceStats(
+        total=sum(by_status.values()),
+        normal=by_status.get('正常', 0),
+        borrowed=by_status.get('借用中', 0),
+        maintenance=by_status.get('维修中', 0),
+        by_status=by_status,
+    )
+
+
+def borrow_stats(session, BorrowRecord, now=None):
+    """一条聚合查询得到各状态的借用记录数以及本月新增数"""
+    start, end = _month_range(now or datetime.now())
+    in_month = case(
+        ((BorrowRecord.created_at >= start) & (BorrowRecord.created_at < end), 1),
+        else_=0,
+    )
+    rows = session.query(
+        BorrowRecord.status,
+        func.count(BorrowRecord.id),
+        func.sum(in_month),
+    ).group_by(BorrowRecord.status).all()
+
+    by_status = {status: count for status, count, _ in rows}
+    return BorrowStats(
+        total=sum(by_status.values()),
+        active=by_status.get('借用中', 0) + by_status.get('超期未还', 0),
+        returned=by_status.get('已归还', 0),
+        overdue=by_status.get('超期未还', 0),
+        this_month=sum(month or 0 for _, _, month in rows),
+        by_status=by_status,
+    )
+
+
+def location_facets(session, Device):
+    """各地点及其设备数，按地点名排序，不含空地点"""
+    rows = (session.query(Device.location, func.count(Device.id))
+            .filter(Device.location.isnot(None), Device.location != '')
+            .group_by(Device.location)
+            .order_by(Device.location)
+            .all())
+    return [(location, count) for location, count in rows]
+
+
+def collect_stats(session, Device, BorrowRecord):
+    """设备和借用记录的全部统计，共两条查询"""
+    return Stats(
+        devices=device_stats(session, Device),
+        borrows=borrow_stats(session, BorrowRecord),
+    )
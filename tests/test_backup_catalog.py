@@ -0,0 +1,63 @@
+"""完整备份索引：结构摘要、与增量备份共用的锁，以及 verify 检查增量快照"""
+
+import os
+import sqlite3
+import threading
+import zlib
+
+import pytest
+
+import backup_database
+
+
+@pytest.fixture
+def source_db(tmp_path):
+    path = str(tmp_path / 'devices.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE device (id INTEGER PRIMARY KEY, name TEXT)')
+    conn.executemany('INSERT INTO device (name) VALUES (?)', [('x' * 100,)] * 500)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_schema_hash_tells_schemas_apart(source_db, tmp_path):
+    before = str(tmp_path / 'before.db')
+    backup_database.online_copy(source_db, before)
+    conn = sqlite3.connect(source_db)
+    conn.execute('ALTER TABLE device ADD COLUMN location TEXT')
+    conn.close()
+    after = str(tmp_path / 'after.db')
+    backup_database.online_copy(source_db, after)
+
+    before_hash, counts = backup_database.describe_backup(before)
+    after_hash, _ = backup_database.describe_backup(after)
+    assert counts == {'device': 500}
+    assert before_hash != after_hash
+    assert after_hash == backup_database.database_schema_hash(source_db)
+
+
+def test_verify_checks_incremental_snapshots(source_db, tmp_path):
+    backup_dir = str(tmp_path / 'backup')
+    assert backup_database.incremental_backup(source_db, backup_dir)
+    assert backup_database.verify_backups(backup_dir, workers=1) == 0
+
+    manifest = backup_database.load_snapshots(backup_dir)[0]
+    path = backup_database.chunk_path(backup_dir, manifest['chunks'][-1])
+    with open(path, 'wb') as f:
+        f.write(zlib.compress(b'\0' * 100))
+    assert backup_database.verify_backups(backup_dir, workers=1) == 1
+    assert not [f for f in os.listdir(backup_dir) if f.endswith('.verify.db')]
+
+
+def test_catalog_update_waits_for_backup_lock(source_db, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with backup_database.backup_lock('backup'):
+        backup = threading.Thread(target=backup_database.backup_database)
+        backup.start()
+        backup.join(0.5)
+        assert backup.is_alive()  # 持有锁期间不能改写索引
+        assert not os.path.exists(backup_database.catalog_path('backup'))
+    backup.join(10)
+    assert not backup.is_alive()
+    assert len(backup_database.load_catalog('backup')) == 1
@@ -0,0 +1,81 @@
+"""借用记录页面和导出的查询次数不随记录数增长（设备随记录一起加载）"""
+
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+from app import data_changed
+from database import db
+from models import BorrowRecord, Device
+
+
+def add_borrowed_devices(count):
+    start = Device.query.count()
+    for i in range(start, start + count):
+        device = Device(name=f'设备{i}', number=f'N{i:05d}', calibration_date=date(2024, 1, 1),
+                        status='借用中')
+        db.session.add(device)
+        db.session.flush()
+        db.session.add(BorrowRecord(device_id=device.id, borrower_name=f'借用人{i}',
+                                    borrow_date=date(2024, 1, 1),
+                                    expected_return_date=date(2024, 1, 8), status='借用中'))
+    db.session.commit()
+    data_changed()
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def count_page_queries(app, client, url):
+    with app.app_context():
+        data_changed()  # 不命中统计和表格片段缓存，统计完整的查询
+        engine = db.engine
+    with QueryCounter(engine) as counter:
+        response = client.get(url)
+        assert response.status_code == 200
+    return counter.count
+
+
+def count_export_queries(app, client, expected_rows):
+    """export_borrow_records() 是流式响应，读完全部内容才算执行完所有查询"""
+    with app.app_context():
+        engine = db.engine
+    with QueryCounter(engine) as counter:
+        response = client.get('/export/borrow_records')
+        body = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert body.count('N0') == expected_rows
+    return counter.count
+
+
+@pytest.mark.parametrize('url', ['/borrow/records', '/return'])
+def test_page_query_count_constant(app, client, url):
+    counts = []
+    for count in (5, 50):
+        with app.app_context():
+            add_borrowed_devices(count - Device.query.count())
+        counts.append(count_page_queries(app, client, url))
+    assert counts[0] == counts[1]
+
+
+def test_export_query_count_constant(app, client):
+    counts = []
+    for count in (5, 50):
+        with app.app_context():
+            add_borrowed_devices(count - Device.query.count())
+        counts.append(count_export_queries(app, client, count))
+    assert counts[0] == counts[1]
@@ -0,0 +1,152 @@
+"""变更日志重放：在备份上重放日志后与原数据库一致"""
+
+import json
+import os
+import sqlite3
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import backup_database
+from database import db
+from models import Device
+
+
+def take_snapshot(app, path):
+    with app.app_context():
+        source = db.engine.url.database
+    backup_database.online_copy(source, path, pages=-1, sleep=0)
+    backup_database.make_standalone(path)
+
+
+def table_rows(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def assert_same_data(app, restored):
+    with app.app_context():
+        live = db.engine.url.database
+    for sql in ("SELECT id, number, status FROM device ORDER BY id",
+                "SELECT id, device_id, borrower_name, status, actual_return_date "
+                "FROM borrow_record ORDER BY id"):
+        assert table_rows(restored, sql) == table_rows(live, sql)
+
+
+def replay(app, snapshot, tmp_path):
+    position = backup_database.journal_position(snapshot)
+    return backup_database.replay_journal(snapshot, datetime.now().isoformat(), since_tx=position,
+                                          journal_dir=str(tmp_path / 'journal'))
+
+
+def add_devices(app, count):
+    with app.app_context():
+        db.session.add_all([Device(name=f'设备{i}', number=f'N{i:05d}',
+                                   calibration_date=date(2024, 1, 1), status='正常')
+                            for i in range(count)])
+        db.session.commit()
+        return [d.id for d in Device.query.order_by(Device.id)]
+
+
+def test_replay_batch_borrow_and_return(app, client, tmp_path):
+    device_ids = add_devices(app, 5)
+    snapshot = str(tmp_path / 'snapshot.db')
+    take_snapshot(app, snapshot)
+
+    response = client.post('/borrow/batch', data={
+        'device_ids': device_ids[:3], 'borrower_name': '批量借用人',
+        'borrow_date': date.today().isoformat()})
+    assert response.status_code == 302
+    client.post('/borrow', data={'device_id': device_ids[3], 'borrower_name': '单台借用人',
+                                 'borrow_date': date.today().isoformat()})
+    with app.app_context():
+        record_ids = [r[0] for r in db.session.execute(db.text(
+            "SELECT id FROM borrow_record WHERE borrower_name = '批量借用人'"))]
+    client.post('/return/batch', data={'record_ids': record_ids[:2],
+                                       'return_date': date.today().isoformat()})
+
+    applied, last = replay(app, snapshot, tmp_path)
+    assert applied >= 3
+    assert_same_data(app, snapshot)
+    assert backup_database.journal_position(snapshot) == last['tx']
+
+
+def test_rolled_back_transaction_not_journaled(app, tmp_path):
+    add_devices(app, 1)
+    snapshot = str(tmp_path / 'snapshot.db')
+    take_snapshot(app, snapshot)
+    with app.app_context():
+        db.session.add(Device(name='回滚', number='ROLLBACK', calibration_date=date(2024, 1, 1)))
+        db.session.flush()
+        db.session.rollback()
+
+    applied, _ = replay(app, snapshot, tmp_path)
+    assert applied == 0
+    assert_same_data(app, snapshot)
+
+
+def test_failed_commit_not_journaled(app, tmp_path):
+    add_devices(app, 1)
+    snapshot = str(tmp_path / 'snapshot.db')
+    take_snapshot(app, snapshot)
+    with app.app_context():
+        # 外键检查推迟到提交时，提交本身失败
+        db.session.execute(db.text('PRAGMA defer_foreign_keys=ON'))
+        db.session.execute(db.text(
+            "INSERT INTO borrow_record (device_id, borrower_name, borrow_date, status) "
+            "VALUES (99999, '不存在的设备', '2024-01-01', '借用中')"))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+    applied, _ = replay(app, snapshot, tmp_path)
+    assert applied == 0
+    assert_same_data(app, snapshot)
+
+
+def write_journal(journal_dir, entries):
+    os.makedirs(journal_dir, exist_ok=True)
+    with open(os.path.join(journal_dir, 'changes-20240101.jsonl'), 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + '\n')
+
+
+def test_replay_follows_commit_order(tmp_path):
+    # 两个进程的日志行写反了：按 prev 链仍然先重放先提交的
+    journal_dir = str(tmp_path / 'journal')
+    write_journal(journal_dir, [
+        {'tx': '2-1', 'prev': '1-1', 'ts': '2024-01-01T00:00:02',
+         'statements': [['UPDATE t SET v = ?', ['second'], False]]},
+        {'tx': '1-1', 'prev': None, 'ts': '2024-01-01T00:00:01',
+         'statements': [['UPDATE t SET v = ?', ['first'], False]]},
+    ])
+    db_file = str(tmp_path / 'db.sqlite')
+    conn = sqlite3.connect(db_file)
+    conn.execute('CREATE TABLE t (v)')
+    conn.execute("INSERT INTO t VALUES ('initial')")
+    conn.execute('CREATE TABLE system_state (key PRIMARY KEY, value, updated_at)')
+    conn.commit()
+    conn.close()
+
+    applied, last = backup_database.replay_journal(db_file, '2024-01-02T00:00:00',
+                                                   journal_dir=journal_dir)
+    assert (applied, last['tx']) == (2, '2-1')
+    assert table_rows(db_file, 'SELECT v FROM t') == [('second',)]
+
+
+def test_malformed_parameters_raise_value_error(tmp_path):
+    # executemany 却只记了一行参数
+    journal_dir = str(tmp_path / 'journal')
+    write_journal(journal_dir, [{'tx': '1-1', 'prev': None, 'ts': '2024-01-01T00:00:00',
+                                 'statements': [['INSERT INTO t (v) VALUES (?)', [1], True]]}])
+    db_file = str(tmp_path / 'db.sqlite')
+    conn = sqlite3.connect(db_file)
+    conn.execute('CREATE TABLE t (v)')
+    conn.close()
+
+    with pytest.raises(ValueError):
+        backup_database.replay_journal(db_file, '2024-01-02T00:00:00', journal_dir=journal_dir)
@@ -0,0 +1,77 @@
+"""多个线程同时借出/归还同一台设备：只有一个请求成功，其余得到 BorrowConflict"""
+
+import threading
+from datetime import date
+
+from app import BorrowConflict, checkin_record, checkout_device
+from database import db
+from models import BorrowRecord, Device
+
+THREADS = 8
+
+
+def hammer(app, action):
+    """THREADS 个线程同时执行 action()，各自独立的会话和连接，返回每个线程的结果"""
+    barrier = threading.Barrier(THREADS)
+    results = []
+    lock = threading.Lock()
+
+    def worker(i):
+        with app.app_context():
+            barrier.wait()
+            try:
+                action(i)
+                db.session.commit()
+                outcome = 'ok'
+            except BorrowConflict:
+                db.session.rollback()
+                outcome = 'conflict'
+            except Exception as e:  # 其他异常（如 database is locked）也要让测试失败
+                db.session.rollback()
+                outcome = repr(e)
+            finally:
+                db.session.remove()
+        with lock:
+            results.append(outcome)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_concurrent_borrow_one_winner(app):
+    with app.app_context():
+        device = Device(name='示波器', number='N00001', calibration_date=date(2024, 1, 1), status='正常')
+        db.session.add(device)
+        db.session.commit()
+        device_id = device.id
+
+    results = hammer(app, lambda i: checkout_device(device_id, borrower_name=f'借用人{i}',
+                                                     borrow_date=date.today()))
+
+    assert results.count('ok') == 1
+    assert results.count('conflict') == THREADS - 1
+    with app.app_context():
+        assert BorrowRecord.query.filter_by(device_id=device_id, status='借用中').count() == 1
+        assert db.session.get(Device, device_id).status == '借用中'
+
+
+def test_concurrent_return_one_winner(app):
+    with app.app_context():
+        device = Device(name='示波器', number='N00001', calibration_date=date(2024, 1, 1), status='正常')
+        db.session.add(device)
+        db.session.commit()
+        record = checkout_device(device.id, borrower_name='借用人', borrow_date=date.today())
+        db.session.commit()
+        device_id, record_id = device.id, record.id
+
+    results = hammer(app, lambda i: checkin_record(record_id, date.today()))
+
+    assert results.count('ok') == 1
+    assert results.count('conflict') == THREADS - 1
+    with app.app_context():
+        assert db.session.get(BorrowRecord, record_id).status == '已归还'
+        assert db.session.get(Device, device_id).status == '正常'
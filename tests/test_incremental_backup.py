@@ -0,0 +1,52 @@
+"""增量备份：块去重、重建一致，以及与清理之间的互斥"""
+
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import backup_database
+
+
+@pytest.fixture
+def source_db(tmp_path):
+    path = str(tmp_path / 'devices.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)')
+    conn.executemany('INSERT INTO t (v) VALUES (?)', [('x' * 200,)] * 5000)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_snapshots_in_same_second_are_distinct(source_db, tmp_path):
+    backup_dir = str(tmp_path / 'backup')
+    assert backup_database.incremental_backup(source_db, backup_dir)
+    assert backup_database.incremental_backup(source_db, backup_dir)
+    manifests = backup_database.load_snapshots(backup_dir)
+    assert len({m['name'] for m in manifests}) == 2
+
+    output = str(tmp_path / 'restored.db')
+    assert backup_database.restore_snapshot(manifests[-1]['name'], backup_dir, output_file=output)
+    assert backup_database.file_checksum(output) == manifests[-1]['sha256']
+
+
+def test_prune_waits_for_backup_lock_and_keeps_part_files(source_db, tmp_path):
+    backup_dir = str(tmp_path / 'backup')
+    assert backup_database.incremental_backup(source_db, backup_dir)
+    part = backup_database.chunk_path(backup_dir, 'ab' * 32) + '.part'
+    os.makedirs(os.path.dirname(part), exist_ok=True)
+    open(part, 'wb').close()
+
+    with backup_database.backup_lock(backup_dir):
+        pruner = threading.Thread(target=backup_database.prune_snapshots,
+                                  kwargs={'backup_dir': backup_dir, 'days_to_keep': 0})
+        pruner.start()
+        pruner.join(0.5)
+        assert pruner.is_alive()  # 持有锁期间清理只能等待
+    pruner.join(10)
+    assert not pruner.is_alive()
+
+    assert backup_database.load_snapshots(backup_dir) == []
+    assert os.path.exists(part)
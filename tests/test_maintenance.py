@@ -0,0 +1,35 @@
+"""维护任务调度：数据库一直繁忙时，到期任务推迟太久也要执行"""
+
+from datetime import datetime, timedelta
+
+import maintenance
+
+INTERVALS = {'checkpoint': 300, 'analyze': 86400}
+MAX_DELAY = 3600
+NOW = datetime(2024, 1, 7, 12, 0, 0)
+
+
+def is_overdue(name, last_runs, started_at):
+    return maintenance.overdue(name, INTERVALS, last_runs, NOW, started_at, MAX_DELAY)
+
+
+def test_never_run_job_overdue_after_max_delay_of_uptime():
+    last_runs = {'analyze': None}
+    assert not is_overdue('analyze', last_runs, NOW - timedelta(seconds=MAX_DELAY - 1))
+    assert is_overdue('analyze', last_runs, NOW - timedelta(seconds=MAX_DELAY + 1))
+
+
+def test_job_overdue_after_interval_plus_max_delay():
+    started_at = NOW - timedelta(days=30)
+    recent = {'checkpoint': NOW - timedelta(seconds=300 + MAX_DELAY - 1)}
+    late = {'checkpoint': NOW - timedelta(seconds=300 + MAX_DELAY + 1)}
+    assert not is_overdue('checkpoint', recent, started_at)
+    assert is_overdue('checkpoint', late, started_at)
+
+
+def test_heartbeat_file(tmp_path):
+    path = str(tmp_path / maintenance.HEARTBEAT_FILE)
+    assert maintenance.read_heartbeat(path) is None
+    maintenance.write_heartbeat(path)
+    maintenance.write_heartbeat(path)
+    assert abs((datetime.now() - maintenance.read_heartbeat(path)).total_seconds()) < 5
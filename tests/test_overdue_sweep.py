@@ -0,0 +1,51 @@
+"""超期标记：只改借用中且已过预计归还日期的记录，事务由调用方提交"""
+
+from datetime import date, datetime, timedelta
+
+import maintenance
+from app import maintenance_settings, maintenance_status, run_maintenance_job, sweep_overdue
+from database import db
+from models import BorrowRecord, Device
+
+
+def add_record(expected_return_date, status='借用中'):
+    device = Device(name='万用表', number=f'N{Device.query.count():05d}',
+                    calibration_date=date(2024, 1, 1), status='借用中')
+    db.session.add(device)
+    db.session.flush()
+    record = BorrowRecord(device_id=device.id, borrower_name='借用人',
+                          borrow_date=expected_return_date - timedelta(days=7),
+                          expected_return_date=expected_return_date, status=status)
+    db.session.add(record)
+    db.session.commit()
+    return record.id
+
+
+def test_sweep_marks_overdue_and_leaves_commit_to_caller(app):
+    today = date.today()
+    with app.app_context():
+        overdue = add_record(today - timedelta(days=1))
+        due_today = add_record(today)
+        returned = add_record(today - timedelta(days=1), status='已归还')
+
+        assert sweep_overdue(today) == 1
+        db.session.rollback()
+        assert db.session.get(BorrowRecord, overdue).status == '借用中'
+
+        assert sweep_overdue(today) == 1
+        db.session.commit()
+        statuses = {rid: db.session.get(BorrowRecord, rid).status
+                    for rid in (overdue, due_today, returned)}
+        assert statuses == {overdue: '超期未还', due_today: '借用中', returned: '已归还'}
+
+
+def test_maintenance_daemon_runs_sweep(app):
+    with app.app_context():
+        record_id = add_record(date.today() - timedelta(days=3))
+        assert 'overdue' in maintenance.due_jobs(maintenance_settings()['intervals'], {}, datetime.now())
+
+        ok, result = run_maintenance_job('overdue', maintenance_settings())
+        assert ok and '1 条' in result
+        db.session.expire_all()
+        assert db.session.get(BorrowRecord, record_id).status == '超期未还'
+        assert maintenance_status()['overdue']['ok']
@@ -0,0 +1,91 @@
+"""普通借用不能占用他人已预约的时段，按预约借出不受自己的预约阻挡"""
+
+from datetime import date, timedelta
+
+import pytest
+
+from app import DeviceReserved, checkout_device, reserve_device
+from database import db
+from models import BorrowRecord, Device, Reservation
+
+TODAY = date.today()
+
+
+@pytest.fixture
+def reserved_device(app):
+    """一台在 [今天+3, 今天+5] 被预约的设备，返回 (设备ID, 预约ID)"""
+    with app.app_context():
+        device = Device(name='频谱仪', number='N00001', calibration_date=date(2024, 1, 1), status='正常')
+        db.session.add(device)
+        db.session.commit()
+        reservation_id = reserve_device(device.id, TODAY + timedelta(days=3), TODAY + timedelta(days=5),
+                                        borrower_name='预约人')
+        db.session.commit()
+        return device.id, reservation_id
+
+
+def test_borrow_overlapping_reservation_rejected(app, reserved_device):
+    device_id, _ = reserved_device
+    with app.app_context():
+        with pytest.raises(DeviceReserved):
+            checkout_device(device_id, borrower_name='他人', borrow_date=TODAY,
+                            expected_return_date=TODAY + timedelta(days=4))
+        db.session.rollback()
+        # 没有预计归还日期的借用视为一直占用，同样冲突
+        with pytest.raises(DeviceReserved):
+            checkout_device(device_id, borrower_name='他人', borrow_date=TODAY)
+        db.session.rollback()
+        assert db.session.get(Device, device_id).status == '正常'
+        assert BorrowRecord.query.count() == 0
+
+
+def test_borrow_before_reservation_allowed(app, reserved_device):
+    device_id, _ = reserved_device
+    with app.app_context():
+        checkout_device(device_id, borrower_name='他人', borrow_date=TODAY,
+                        expected_return_date=TODAY + timedelta(days=2))
+        db.session.commit()
+        assert db.session.get(Device, device_id).status == '借用中'
+
+
+def test_borrow_route_reports_reservation(client, reserved_device):
+    device_id, _ = reserved_device
+    response = client.post('/borrow', data={
+        'device_id': device_id, 'borrower_name': '他人', 'borrow_date': TODAY.isoformat(),
+        'expected_return_date': (TODAY + timedelta(days=4)).isoformat()}, follow_redirects=True)
+    assert '已被预约' in response.get_data(as_text=True)
+
+    response = client.post('/borrow/batch', data={
+        'device_ids': device_id, 'borrower_name': '他人', 'borrow_date': TODAY.isoformat()},
+        follow_redirects=True)
+    assert '在借用期间已被预约' in response.get_data(as_text=True)
+
+
+def test_checkout_own_reservation(app, client, reserved_device):
+    device_id, reservation_id = reserved_device
+    client.post(f'/reservation/checkout/{reservation_id}')
+    with app.app_context():
+        assert db.session.get(Reservation, reservation_id).status == '已借出'
+        assert db.session.get(Device, device_id).status == '借用中'
+
+
+def test_delete_device_with_active_reservation_refused(app, client, reserved_device):
+    device_id, reservation_id = reserved_device
+    response = client.post(f'/device/delete/{device_id}', follow_redirects=True)
+    assert response.status_code == 200
+    assert '有效预约' in response.get_data(as_text=True)
+    with app.app_context():
+        assert db.session.get(Device, device_id) is not None
+
+
+def test_delete_device_removes_finished_reservations(app, client, reserved_device):
+    device_id, reservation_id = reserved_device
+    with app.app_context():
+        db.session.get(Reservation, reservation_id).status = '已取消'
+        db.session.commit()
+
+    response = client.post(f'/device/delete/{device_id}')
+    assert response.status_code == 302
+    with app.app_context():
+        assert db.session.get(Device, device_id) is None
+        assert db.session.get(Reservation, reservation_id) is None
@@ -0,0 +1,48 @@
+"""使用率报表只读取已有的日汇总，请求本身不写数据库"""
+
+from datetime import date, timedelta
+
+from app import update_utilization, utilization_rolled_through
+from database import db
+from models import BorrowRecord, Device, DeviceUsageDaily
+
+
+def add_history(app):
+    with app.app_context():
+        device = Device(name='万用表', number='N00001', calibration_date=date(2024, 1, 1), status='正常')
+        db.session.add(device)
+        db.session.flush()
+        start = date.today() - timedelta(days=10)
+        db.session.add(BorrowRecord(device_id=device.id, borrower_name='借用人', borrow_date=start,
+                                    expected_return_date=start + timedelta(days=3),
+                                    actual_return_date=start + timedelta(days=3), status='已归还'))
+        db.session.commit()
+
+
+def test_report_does_not_roll_up(app, client):
+    add_history(app)
+
+    response = client.get('/api/utilization')
+    assert response.status_code == 400
+    assert '尚未汇总' in response.get_json()['message']
+    with app.app_context():
+        assert utilization_rolled_through() is None
+        assert DeviceUsageDaily.query.count() == 0
+
+
+def test_report_shows_rolled_through(app, client):
+    add_history(app)
+    with app.app_context():
+        update_utilization(today=date.today() - timedelta(days=2))
+
+    report = client.get('/api/utilization').get_json()
+    assert report['rolled_through'] == (date.today() - timedelta(days=3)).isoformat()
+    assert report['stale'] is True
+    assert report['rows'][0]['borrowed_days'] > 0
+    with app.app_context():
+        # 请求没有把汇总补到昨天
+        assert utilization_rolled_through() == date.today() - timedelta(days=3)
+
+    html = client.get('/reports/utilization').get_data(as_text=True)
+    assert '汇总数据截至 ' + report['rolled_through'] in html
+    assert '没有更新到昨天' in html
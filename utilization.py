@@ -0,0 +1,130 @@
+"""
+设备使用率日汇总
+
+每台设备每天一行：当天是否处于借出状态（borrowed_days）、当天新借出次数
+（borrow_count）、当天是否超期未还（overdue_days）。只为有借用的日子写行，
+没有借用的设备/日期不占空间。汇总只覆盖已经结束的日子（最晚到昨天），
+当天和仍未归还的借用在第二天汇总时才计入。
+
+使用率报表只读汇总表，一年的查询不需要回到原始借用记录。
+模型类由调用方传入，避免与 app.py 循环导入。
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from sqlalchemy import delete, func, insert, or_, select
+
+# 每批写入的汇总行数
+INSERT_BATCH_SIZE = 1000
+
+GROUP_BY_CHOICES = ('device', 'model', 'location')
+
+
+def _days(start, end):
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def device_days(records, start, end):
+    """把借用记录展开为 {(设备ID, 日期): [借出天数, 借出次数, 超期天数]}
+
+    借用日期和归还日期当天都算借出；未归还的记录算到 end 为止。
+    超期从预计归还日期的次日算起。
+    """
+    days = defaultdict(lambda: [0, 0, 0])
+    for device_id, borrow_date, expected_return_date, actual_return_date in records:
+        if start <= borrow_date <= end:
+            days[(device_id, borrow_date)][1] += 1
+
+        last = min(actual_return_date or end, end)
+        for day in _days(max(borrow_date, start), last):
+            row = days[(device_id, day)]
+            row[0] = 1
+            if expected_return_date is not None and day > expected_return_date:
+                row[2] = 1
+    return days
+
+
+def rollup(session, BorrowRecord, DeviceUsageDaily, start, end, device_ids=None):
+    """重新计算 [start, end] 内的日汇总（调用方负责提交事务），返回写入的行数
+
+    device_ids 为 None 时处理全部设备，否则只重算这些设备（ID 列表或子查询）。
+    先删除范围内的旧汇总再整批写入，重复执行结果相同。
+    """
+    if end < start:
+        return 0
+
+    stale = delete(DeviceUsageDaily).where(DeviceUsageDaily.day >= start,
+                                           DeviceUsageDaily.day <= end)
+    # 与设备表内联接，跳过设备已删除的遗留记录（汇总表的 device_id 有外键约束）
+    records = select(BorrowRecord.device_id, BorrowRecord.borrow_date,
+                     BorrowRecord.expected_return_date, BorrowRecord.actual_return_date).join(
+        BorrowRecord.device).where(
+        BorrowRecord.borrow_date <= end,
+        or_(BorrowRecord.actual_return_date.is_(None), BorrowRecord.actual_return_date >= start)
+    )
+    if device_ids is not None:
+        stale = stale.where(DeviceUsageDaily.device_id.in_(device_ids))
+        records = records.where(BorrowRecord.device_id.in_(device_ids))
+
+    session.execute(stale.execution_options(synchronize_session=False))
+    days = device_days(session.execute(records), start, end)
+
+    rows = [
+        {'device_id': device_id, 'day': day,
+         'borrowed_days': borrowed, 'borrow_count': count, 'overdue_days': overdue}
+        for (device_id, day), (borrowed, count, overdue) in sorted(days.items())
+    ]
+    for i in range(0, len(rows), INSERT_BATCH_SIZE):
+        session.execute(insert(DeviceUsageDaily), rows[i:i + INSERT_BATCH_SIZE])
+    return len(rows)
+
+
+def utilization_report(session, Device, DeviceUsageDaily, start, end, group_by='device'):
+    """按设备、型号或地点汇总 [start, end] 内的使用率
+
+    一条查询：先在汇总表上按设备求和，再与设备表外联接分组，
+    没有借用的设备也计入分母。使用率 = 借出天数 / (设备数 × 天数)。
+    """
+    usage = (
+        select(DeviceUsageDaily.device_id,
+               func.sum(DeviceUsageDaily.borrowed_days).label('borrowed_days'),
+               func.sum(DeviceUsageDaily.borrow_count).label('borrow_count'),
+               func.sum(DeviceUsageDaily.overdue_days).label('overdue_days'))
+        .where(DeviceUsageDaily.day >= start, DeviceUsageDaily.day <= end)
+        .group_by(DeviceUsageDaily.device_id)
+        .subquery('usage')
+    )
+
+    if group_by == 'device':
+        keys = [Device.id, Device.name, Device.number]
+    elif group_by == 'model':
+        keys = [Device.model]
+    elif group_by == 'location':
+        keys = [Device.location]
+    else:
+        raise ValueError(f'group_by 只能是 {GROUP_BY_CHOICES} 之一')
+
+    query = (
+        select(*keys,
+               func.count(Device.id).label('devices'),
+               func.coalesce(func.sum(usage.c.borrowed_days), 0).label('borrowed_days'),
+               func.coalesce(func.sum(usage.c.borrow_count), 0).label('borrow_count'),
+               func.coalesce(func.sum(usage.c.overdue_days), 0).label('overdue_days'))
+        .select_from(Device)
+        .outerjoin(usage, usage.c.device_id == Device.id)
+        .group_by(*keys)
+        .order_by(*keys)
+    )
+
+    period_days = (end - start).days + 1
+    report = []
+    for row in session.execute(query):
+        item = dict(row._mapping)
+        capacity = item['devices'] * period_days
+        item['utilization'] = round(100.0 * item['borrowed_days'] / capacity, 2) if capacity else 0.0
+        report.append(item)
+    return report